@@ -3,10 +3,17 @@ import traceback
 
 from ui_form import render_form_view
 from ui_results import render_results_view
-from pipeline import answer_question, index_only
+from pipeline import answer_question, chat_turn, index_only
+from llm_runner import StudySession
+from chat import ChatSession
+from maintenance import start_background_maintenance
+from router import resolve_model
 
 st.set_page_config(page_title="AI Study Assistant (RAG)", layout="centered")
 
+# Periodic GC + compaction of chroma_db/ (no-op if already running in this process)
+start_background_maintenance()
+
 # -------- Session State Defaults --------
 if "indexed" not in st.session_state:
     st.session_state["indexed"] = False
@@ -23,6 +30,15 @@ if "result" not in st.session_state:
 if "error" not in st.session_state:
     st.session_state["error"] = None
 
+if "llm_session" not in st.session_state:
+    st.session_state["llm_session"] = None  # StudySession, reused across Asks
+
+if "results_history" not in st.session_state:
+    st.session_state["results_history"] = []  # for bulk export
+
+if "chat" not in st.session_state:
+    st.session_state["chat"] = None  # ChatSession for "chat" mode
+
 # If somehow an invalid view value gets set, recover gracefully
 if st.session_state["view"] not in ("form", "result"):
     st.session_state["view"] = "form"
@@ -46,10 +62,14 @@ if st.session_state["view"] == "form":
                 idx = index_only(
                     uploaded_file=data["uploaded_file"],
                     pasted_text=data["pasted_text"],
+                    precompute=data.get("precompute", False),
+                    model=data["model"],
                 )
 
             st.session_state["indexed"] = True
             st.session_state["index_info"] = idx
+            st.session_state["llm_session"] = None  # new notes -> new prompt prefix
+            st.session_state["chat"] = None
 
             # Clear stale error/result AFTER successful indexing too (belt + suspenders)
             st.session_state["error"] = None
@@ -62,6 +82,10 @@ if st.session_state["view"] == "form":
             st.session_state["index_info"] = None
             st.session_state["error"] = traceback.format_exc()
 
+    if data.get("reset_chat"):
+        st.session_state["chat"] = None
+        st.rerun()
+
     # -------- ASK --------
     if data.get("ask_submit"):
         try:
@@ -72,18 +96,50 @@ if st.session_state["view"] == "form":
             if not st.session_state.get("indexed"):
                 raise ValueError("Please click 'Index Notes' first.")
 
+            session = None
+            if data.get("reuse_session"):
+                session = st.session_state.get("llm_session")
+                # a session pins one model for prefix reuse; "auto" uses the large tier
+                session_model = resolve_model(data["model"])
+                if session is None or session.model != session_model:
+                    session = StudySession(model=session_model)
+                    st.session_state["llm_session"] = session
+
             with st.spinner("Answering… (retrieve top-k → Ollama)"):
-                result = answer_question(
-                    uploaded_file=data["uploaded_file"],
-                    pasted_text=data["pasted_text"],
-                    question=data["question"],
-                    mode=data["mode"],
-                    model=data["model"],
-                    top_k=data["top_k"],
-                )
+                if data["mode"] == "chat":
+                    chat = st.session_state.get("chat")
+                    notes_hash = (st.session_state.get("index_info") or {}).get("notes_hash")
+                    if chat is None or chat.notes_hash != notes_hash:
+                        chat = ChatSession(notes_hash=notes_hash)
+                        st.session_state["chat"] = chat
+
+                    result = chat_turn(
+                        chat,
+                        uploaded_file=data["uploaded_file"],
+                        pasted_text=data["pasted_text"],
+                        question=data["question"],
+                        model=data["model"],
+                        top_k=data["top_k"],
+                        session=session,
+                        rerank=data.get("rerank", False),
+                    )
+                else:
+                    result = answer_question(
+                        uploaded_file=data["uploaded_file"],
+                        pasted_text=data["pasted_text"],
+                        question=data["question"],
+                        mode=data["mode"],
+                        model=data["model"],
+                        top_k=data["top_k"],
+                        mcq_fanout=data.get("mcq_fanout", False),
+                        session=session,
+                        rerank=data.get("rerank", False),
+                        use_artifacts=data.get("use_artifacts", False),
+                    )
 
             # Success path: store result and clear error
             st.session_state["result"] = result
+            st.session_state["results_history"] = (st.session_state["results_history"] + [result])[-50:]
             st.session_state["error"] = None
 
             st.session_state["view"] = "result"
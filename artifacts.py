@@ -0,0 +1,243 @@
+# artifacts.py
+"""
+Precomputed study artifacts, generated in the background after indexing.
+
+The chunks of an indexed document are clustered into topics with their stored
+embeddings (spherical k-means). Each topic gets revision notes (NOTES_PROMPT)
+and MCQs (MCQ_PROMPT) generated once, saved to ARTIFACTS_DIR/<notes_hash>.json.
+A notes/mcq request whose question embeds close to a topic centroid is then
+served from disk instead of paying retrieval + an LLM round-trip.
+"""
+from __future__ import annotations
+
+import copy
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import rag
+from llm_runner import CHUNK_SEPARATOR, MAX_CONTEXT_CHARS, run_study_llm
+
+ARTIFACTS_DIR = os.path.join(rag.PERSIST_DIR, "artifacts")
+ARTIFACT_TOPICS = 6
+ARTIFACT_MODES = ("notes", "mcq")
+# Minimum cosine similarity between the question and a topic centroid to serve from disk
+ARTIFACT_MATCH_THRESHOLD = 0.7
+# Only topic-level requests ("photosynthesis", "cell transport basics") are served;
+# specific questions need their own retrieval + answer
+ARTIFACT_MAX_QUERY_WORDS = 6
+TOPIC_QUESTION = "The main topic covered in this context"
+
+# One background worker: artifact builds queue behind each other instead of
+# competing with interactive requests for the model.
+_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifacts")
+_BUILDS: Dict[str, Future] = {}
+_LOCK = threading.Lock()
+_LOADED: Dict[str, tuple] = {}  # notes_hash -> (mtime, data, centroids)
+
+
+def _path(notes_hash: str) -> str:
+    return os.path.join(ARTIFACTS_DIR, f"{notes_hash}.json")
+
+
+# ---------- clustering ----------
+
+def cluster_topics(embeddings: np.ndarray, k: int, iters: int = 25, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means on normalized embeddings.
+    Returns (labels (n,), centroids (k, dim), normalized).
+    """
+    x = np.asarray(embeddings, dtype=np.float32)
+    n = x.shape[0]
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+
+    # k-means++ style seeding on cosine distance
+    centroids = [x[rng.integers(n)]]
+    for _ in range(1, k):
+        d = 1.0 - np.max(x @ np.stack(centroids).T, axis=1)
+        d = np.clip(d, 0, None)
+        p = d / d.sum() if d.sum() > 0 else None
+        centroids.append(x[rng.choice(n, p=p)])
+    c = np.stack(centroids)
+
+    labels = np.zeros(n, dtype=np.int64)
+    for it in range(iters):
+        new_labels = np.argmax(x @ c.T, axis=1)
+        if it > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for j in range(k):
+            members = x[labels == j]
+            if len(members):
+                v = members.sum(axis=0)
+                c[j] = v / (np.linalg.norm(v) or 1.0)
+
+    return labels, c
+
+
+# ---------- build ----------
+
+def build_artifacts(notes_hash: str, model: str, n_topics: int = ARTIFACT_TOPICS, modes=ARTIFACT_MODES) -> dict:
+    """
+    Clusters the indexed chunks of notes_hash into topics and generates
+    notes / MCQs per topic. Writes and returns the artifact file contents.
+    """
+    data = rag.get_indexed_chunks(notes_hash)
+    docs, metas, embs = data["documents"], data["metadatas"], data["embeddings"]
+    if not docs:
+        raise ValueError(f"No indexed chunks for notes_hash={notes_hash}")
+
+    labels, centroids = cluster_topics(embs, n_topics)
+    print(f"Artifacts: {len(docs)} chunks -> {len(centroids)} topics (notes_hash={notes_hash})", flush=True)
+
+    topics = []
+    for j, centroid in enumerate(centroids):
+        members = np.where(labels == j)[0]
+        if not len(members):
+            continue
+        # most central chunks first, up to the usual context budget
+        members = members[np.argsort(-(embs[members] @ centroid))]
+        chosen, used = [], 0
+        for i in members:
+            size = len(docs[i]) + len(CHUNK_SEPARATOR)
+            if chosen and used + size > MAX_CONTEXT_CHARS:
+                break
+            chosen.append(int(i))
+            used += size
+
+        context = CHUNK_SEPARATOR.join(docs[i] for i in chosen)
+        sources = [
+            {
+                "rank": r + 1,
+                "chunk": docs[i],
+                "notes_hash": (metas[i] or {}).get("notes_hash"),
+                "chunk_id": (metas[i] or {}).get("chunk_id"),
+                "distance": float(2.0 - 2.0 * float(embs[i] @ centroid)),
+            }
+            for r, i in enumerate(chosen)
+        ]
+
+        topic = {"topic_id": j, "centroid": centroid.tolist(), "sources": sources, "results": {}}
+        for mode in modes:
+            try:
+                topic["results"][mode] = run_study_llm(model=model, mode=mode, context=context, question=TOPIC_QUESTION)
+            except Exception as e:
+                print(f"Artifacts: topic {j} {mode} failed: {e}", flush=True)
+        topic["label"] = next((r.get("topic") for r in topic["results"].values() if r.get("topic")), f"Topic {j + 1}")
+        topics.append(topic)
+
+    out = {"notes_hash": notes_hash, "model": model, "created_at": time.time(), "topics": topics}
+
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+    tmp = _path(notes_hash) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(out, f, ensure_ascii=False)
+    os.replace(tmp, _path(notes_hash))
+    return out
+
+
+def start_build(notes_hash: str, model: str, force: bool = False) -> Optional[Future]:
+    """
+    Queues a background build unless one is running or artifacts already exist.
+    """
+    with _LOCK:
+        fut = _BUILDS.get(notes_hash)
+        if fut is not None and not fut.done():
+            return fut
+        if not force and os.path.exists(_path(notes_hash)):
+            return None
+        fut = _EXECUTOR.submit(build_artifacts, notes_hash, model)
+        _BUILDS[notes_hash] = fut
+        return fut
+
+
+def status(notes_hash: str) -> str:
+    """
+    "ready" | "building" | "failed" | "none"
+    """
+    with _LOCK:
+        fut = _BUILDS.get(notes_hash)
+    if fut is not None and not fut.done():
+        return "building"
+    if os.path.exists(_path(notes_hash)):
+        return "ready"
+    if fut is not None and fut.exception() is not None:
+        return "failed"
+    return "none"
+
+
+def delete(notes_hash: str) -> None:
+    with _LOCK:
+        _LOADED.pop(notes_hash, None)
+    try:
+        os.remove(_path(notes_hash))
+    except FileNotFoundError:
+        pass
+
+
+# ---------- serve ----------
+
+def _load(notes_hash: str) -> Optional[tuple]:
+    path = _path(notes_hash)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _LOCK:
+        cached = _LOADED.get(notes_hash)
+    if cached is not None and cached[0] == mtime:
+        return cached
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    centroids = np.asarray([t["centroid"] for t in data["topics"]], dtype=np.float32)
+    entry = (mtime, data, centroids)
+    with _LOCK:
+        _LOADED[notes_hash] = entry
+    return entry
+
+
+def is_topic_request(question: str) -> bool:
+    """
+    A short topic phrase rather than a specific question.
+    """
+    q = question.strip()
+    return bool(q) and "?" not in q and len(q.split()) <= ARTIFACT_MAX_QUERY_WORDS
+
+
+def lookup(notes_hash: str, question: str, mode: str, threshold: float = ARTIFACT_MATCH_THRESHOLD) -> Optional[dict]:
+    """
+    Precomputed result for (notes_hash, mode) whose topic best matches a
+    topic-level request, or None for specific questions, when nothing is
+    stored, or when no topic is close enough.
+    """
+    if mode not in ARTIFACT_MODES or not is_topic_request(question):
+        return None
+    entry = _load(notes_hash)
+    if entry is None or not len(entry[2]):
+        return None
+    _, data, centroids = entry
+
+    q = np.asarray(rag._embed([question])[0], dtype=np.float32)
+    sims = centroids @ q
+    best = int(np.argmax(sims))
+    topic = data["topics"][best]
+    if sims[best] < threshold or mode not in topic["results"]:
+        return None
+
+    result = copy.deepcopy(topic["results"][mode])
+    result["sources"] = copy.deepcopy(topic["sources"])
+    result["precomputed"] = {"topic": topic["label"], "similarity": float(sims[best])}
+    return result
+
+
+def list_topics(notes_hash: str) -> List[str]:
+    entry = _load(notes_hash)
+    return [t["label"] for t in entry[1]["topics"]] if entry else []
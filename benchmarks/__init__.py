@@ -0,0 +1,2 @@
+# Standalone benchmark / evaluation scripts.
+# Run from the repo root, e.g.: python -m benchmarks.bench_prefill --help
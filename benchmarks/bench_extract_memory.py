@@ -0,0 +1,104 @@
+"""
+Extraction memory benchmark: previous in-memory path vs spooled / mmap / streaming path.
+
+Measures peak Python heap (tracemalloc) and wall time for:
+  - old: getvalue() -> BytesIO -> joined text -> clean_text (replace/split/2 lists/join)
+  - new: extract.extract_notes(max_workers=1), the in-process streaming path
+    (tracemalloc only sees this process, so the worker pool is not measured here;
+    see bench_extractors for pool throughput)
+
+Usage:
+  python -m benchmarks.bench_extract_memory --file textbook.pdf
+  python -m benchmarks.bench_extract_memory --synthetic-mb 50     # clean_text only
+"""
+from __future__ import annotations
+import argparse
+import os
+import time
+import tracemalloc
+from io import BytesIO
+
+from extract import clean_text, extract_notes, iter_clean_lines
+
+
+class _Upload(BytesIO):
+    """Stand-in for Streamlit's UploadedFile (a BytesIO with a name)."""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+# ---------- previous implementation (reference) ----------
+
+def _old_clean_text(text):
+    t = (text or "").replace("\r", "\n")
+    lines = [ln.strip() for ln in t.split("\n")]
+    lines = [ln for ln in lines if ln]
+    return "\n".join(lines).strip()
+
+
+def _old_extract(uploaded_file) -> str:
+    from pypdf import PdfReader
+    from docx import Document
+
+    name = (uploaded_file.name or "").lower()
+    file_bytes = uploaded_file.getvalue()
+    if name.endswith(".pdf"):
+        reader = PdfReader(BytesIO(file_bytes))
+        parts = [p.extract_text() or "" for p in reader.pages]
+        return "\n".join(p for p in parts if p.strip()).strip()
+    if name.endswith(".docx"):
+        doc = Document(BytesIO(file_bytes))
+        return "\n".join(p.text.strip() for p in doc.paragraphs if (p.text or "").strip()).strip()
+    return ""
+
+
+def _measure(fn, *args) -> tuple[object, float, float]:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    out = fn(*args)
+    wall = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, peak / 1e6, wall
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--file", help=".pdf or .docx to extract")
+    ap.add_argument("--synthetic-mb", type=float, default=0, help="Size of generated text for the clean_text comparison")
+    args = ap.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            data = f.read()
+        name = os.path.basename(args.file)
+        size_mb = len(data) / 1e6
+
+        # the upload itself is already in memory in both cases (Streamlit holds it)
+        old, old_peak, old_wall = _measure(lambda: _old_clean_text(_old_extract(_Upload(data, name))))
+        new, new_peak, new_wall = _measure(lambda: extract_notes(_Upload(data, name), max_workers=1)[0])
+
+        assert old == new, "new path must produce identical text"
+        print(f"{name}: {size_mb:.1f} MB file, {len(new) / 1e6:.1f} M chars of text")
+        print(f"  old: peak {old_peak:8.1f} MB  ({old_peak / size_mb:.1f}x file)  {old_wall:.2f} s")
+        print(f"  new: peak {new_peak:8.1f} MB  ({new_peak / size_mb:.1f}x file)  {new_wall:.2f} s")
+
+    if args.synthetic_mb:
+        line = "  Osmosis is the movement of water across a semi-permeable membrane.  \r\n\n"
+        pages = [line * int(args.synthetic_mb * 1e6 / len(line) / 200)] * 200
+
+        text = "\n".join(pages)
+        _, old_peak, old_wall = _measure(_old_clean_text, text)
+        _, new_peak, new_wall = _measure(clean_text, text)
+        _, stream_peak, stream_wall = _measure(lambda: "\n".join(iter_clean_lines(pages)))
+        print(f"clean_text on {len(text) / 1e6:.0f} M chars:")
+        print(f"  old            peak {old_peak:8.1f} MB  {old_wall:.2f} s")
+        print(f"  new (string)   peak {new_peak:8.1f} MB  {new_wall:.2f} s")
+        print(f"  new (per page) peak {stream_peak:8.1f} MB  {stream_wall:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
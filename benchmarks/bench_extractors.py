@@ -0,0 +1,82 @@
+"""
+Extractor throughput per format, sequential vs worker pool.
+
+Synthetic .txt / .md / .html documents are generated in memory; real .pdf /
+.docx / .pptx files can be added with --file (repeatable). Each input is run
+through extract.extract_notes with max_workers=1 and with the pool, and the
+report shows MB/s, units/s and the text length (which must match).
+
+Usage:
+  python -m benchmarks.bench_extractors --synthetic-mb 5
+  python -m benchmarks.bench_extractors --file book.pdf --file slides.pptx --workers 4
+"""
+from __future__ import annotations
+import argparse
+import os
+import time
+from io import BytesIO
+
+from extract import EXTRACT_WORKERS, extract_notes
+
+PARAGRAPH = "Osmosis is the movement of water across a semi-permeable membrane. " * 4
+
+
+class _Upload(BytesIO):
+    """Stand-in for Streamlit's UploadedFile (a BytesIO with a name)."""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+def _synthetic(fmt: str, size_mb: float) -> bytes:
+    n = max(1, int(size_mb * 1e6 / (len(PARAGRAPH) + 40)))
+    if fmt == "md":
+        body = "".join(f"## Section {i}\n\n- {PARAGRAPH}\n\n" if i % 10 == 0 else f"{PARAGRAPH}\n\n" for i in range(n))
+    elif fmt == "html":
+        body = "<html><body>" + "".join(
+            f"<h2>Section {i}</h2><p>{PARAGRAPH}</p>" if i % 10 == 0 else f"<p>{PARAGRAPH}</p>" for i in range(n)
+        ) + "</body></html>"
+    else:
+        body = "".join(f"{PARAGRAPH}\n" for _ in range(n))
+    return body.encode("utf-8")
+
+
+def _run(files: list, workers: int) -> tuple[float, str, list]:
+    t0 = time.perf_counter()
+    text, spans = extract_notes([_Upload(data, name) for name, data in files], max_workers=workers)
+    return time.perf_counter() - t0, text, spans
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--file", action="append", default=[], help="Real document to include (.pdf/.docx/.pptx/...)")
+    ap.add_argument("--synthetic-mb", type=float, default=2.0, help="Size of each generated txt/md/html document")
+    ap.add_argument("--workers", type=int, default=EXTRACT_WORKERS)
+    args = ap.parse_args()
+
+    inputs = [(f"synthetic.{fmt}", _synthetic(fmt, args.synthetic_mb)) for fmt in ("txt", "md", "html")] \
+        if args.synthetic_mb > 0 else []
+    for path in args.file:
+        with open(path, "rb") as f:
+            inputs.append((os.path.basename(path), f.read()))
+
+    print(f"{'file':<24} {'MB':>6} {'units':>6} {'seq s':>7} {'MB/s':>7} {'pool s':>7} {'MB/s':>7}")
+    for name, data in inputs:
+        mb = len(data) / 1e6
+        seq_s, seq_text, spans = _run([(name, data)], 1)
+        pool_s, pool_text, _ = _run([(name, data)], args.workers)
+        assert seq_text == pool_text, "pool must produce identical text"
+        print(f"{name:<24} {mb:>6.1f} {len(spans):>6} {seq_s:>7.2f} {mb / seq_s:>7.1f} {pool_s:>7.2f} {mb / pool_s:>7.1f}")
+
+    # all files in one upload: the case the pool is for
+    if len(inputs) > 1:
+        mb = sum(len(d) for _, d in inputs) / 1e6
+        seq_s, seq_text, spans = _run(inputs, 1)
+        pool_s, pool_text, _ = _run(inputs, args.workers)
+        assert seq_text == pool_text, "pool must produce identical text"
+        print(f"{'(all files)':<24} {mb:>6.1f} {len(spans):>6} {seq_s:>7.2f} {mb / seq_s:>7.1f} {pool_s:>7.2f} {mb / pool_s:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
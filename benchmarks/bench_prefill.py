@@ -0,0 +1,110 @@
+"""
+Prefill benchmark: stateless prompts vs StudySession prefix reuse.
+
+For each question (asked in the given modes), retrieves top-k chunks and sends
+the prompt twice through the Ollama server API:
+  - stateless: the per-question context, as answer_question builds it
+  - session:   StudySession's pinned context (byte-identical prefix)
+
+Ollama only reports prompt_eval for tokens it did NOT take from its KV cache,
+so the prompt tokens / prefill time columns show what each layout pays.
+
+Usage:
+  python -m benchmarks.bench_prefill --notes notes.txt --model mistral:7b \
+      --question "What is osmosis?" --question "Explain the second point more" --repeat 2
+"""
+from __future__ import annotations
+import argparse
+import statistics
+import time
+
+from benchmarks.scratch_store import scratch_store
+from extract import clean_text
+from llm_prompts import SYSTEM_PROMPT, CONTEXT_BLOCK, TASK_PROMPTS, SCHEMAS
+from llm_runner import StudySession, MAX_CONTEXT_CHARS, CHUNK_SEPARATOR
+from ollama_client import ollama_chat_api
+from rag import index_notes, retrieve_sources
+
+
+def _prefill_ms(stats: dict) -> float:
+    return (stats.get("prompt_eval_duration") or 0) / 1e6
+
+
+def run(notes_text: str, questions: list[str], modes: list[str], model: str, top_k: int, repeat: int) -> dict:
+    index_notes(notes_text)
+    session = StudySession(model=model)
+    rows = []
+
+    for _ in range(repeat):
+        for question in questions:
+            for mode in modes:
+                retr = retrieve_sources(notes_text=notes_text, question=question, top_k=top_k)
+                chunks = [s["chunk"] for s in retr["sources"]]
+                task = TASK_PROMPTS[mode].format(question=question)
+
+                # stateless layout: context depends on this question's retrieval order
+                stateless_ctx = CHUNK_SEPARATOR.join(chunks)[:MAX_CONTEXT_CHARS]
+                t0 = time.perf_counter()
+                stateless = ollama_chat_api(
+                    model,
+                    [
+                        {"role": "system", "content": SYSTEM_PROMPT.strip()},
+                        {"role": "user", "content": (CONTEXT_BLOCK.format(context=stateless_ctx) + task).strip()},
+                    ],
+                    format=SCHEMAS[mode],
+                    options={"temperature": 0.0},
+                )
+                stateless_wall = time.perf_counter() - t0
+
+                session_ctx = session.build_context(chunks)
+                t0 = time.perf_counter()
+                session.chat(CONTEXT_BLOCK.format(context=session_ctx) + task, format=SCHEMAS[mode])
+                session_wall = time.perf_counter() - t0
+
+                rows.append({
+                    "mode": mode,
+                    "question": question,
+                    "stateless_prompt_tokens": stateless.get("prompt_eval_count"),
+                    "stateless_prefill_ms": _prefill_ms(stateless),
+                    "stateless_wall_s": stateless_wall,
+                    "session_prompt_tokens": session.stats[-1].get("prompt_eval_count"),
+                    "session_prefill_ms": _prefill_ms(session.stats[-1]),
+                    "session_wall_s": session_wall,
+                })
+
+    return {"rows": rows}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--notes", required=True, help="Path to a UTF-8 text file with study notes")
+    ap.add_argument("--question", action="append", required=True)
+    ap.add_argument("--mode", action="append", choices=["qa", "notes", "mcq"])
+    ap.add_argument("--model", default="mistral:7b")
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--repeat", type=int, default=2)
+    args = ap.parse_args()
+
+    with open(args.notes, encoding="utf-8") as f:
+        notes_text = clean_text(f.read())
+
+    with scratch_store():  # never index into the app's store
+        report = run(notes_text, args.question, args.mode or ["qa"], args.model, args.top_k, args.repeat)
+    rows = report["rows"]
+
+    print(f"{'mode':<6} {'stateless tok':>13} {'prefill ms':>10} {'session tok':>11} {'prefill ms':>10}  question")
+    for r in rows:
+        print(
+            f"{r['mode']:<6} {r['stateless_prompt_tokens'] or 0:>13} {r['stateless_prefill_ms']:>10.1f} "
+            f"{r['session_prompt_tokens'] or 0:>11} {r['session_prefill_ms']:>10.1f}  {r['question'][:40]}"
+        )
+
+    # the first session call pays the full prefix; the interesting number is the rest
+    later = rows[1:] or rows
+    print()
+    print(f"median prefill (after first call): stateless={statistics.median(r['stateless_prefill_ms'] for r in later):.1f} ms  "
+          f"session={statistics.median(r['session_prefill_ms'] for r in later):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
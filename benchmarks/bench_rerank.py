@@ -0,0 +1,102 @@
+"""
+Rerank benchmark: plain top-k vs over-fetch + cross-encoder rerank to fewer chunks.
+
+For every labeled question it reports, per configuration:
+  - retrieval (+ rerank) latency
+  - context chars sent to the LLM
+  - hit rate: whether the supporting span appears in the kept chunks
+  - optionally (--model) the end-to-end LLM time, which is where the shorter prompt pays off
+
+Labels file: JSONL with {"question": "...", "span": "verbatim text from the notes"}.
+
+Usage:
+  python -m benchmarks.bench_rerank --notes notes.txt --labels labels.jsonl \
+      --baseline-k 8 --rerank-k 3 --candidates 20 [--model mistral:7b]
+"""
+from __future__ import annotations
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.scratch_store import scratch_store
+from extract import clean_text
+from llm_runner import run_study_llm
+from rag import index_notes, retrieve_sources
+
+
+def _norm(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _measure(notes_text: str, labels: list[dict], top_k: int, rerank: bool, candidates: int, model: str | None) -> dict:
+    retrieval_s, llm_s, ctx_chars, hits = [], [], [], 0
+
+    for item in labels:
+        t0 = time.perf_counter()
+        retr = retrieve_sources(notes_text=notes_text, question=item["question"], top_k=top_k,
+                                rerank=rerank, candidates=candidates)
+        retrieval_s.append(time.perf_counter() - t0)
+
+        context = retr["context"]
+        ctx_chars.append(len(context))
+        if _norm(item["span"]) in _norm(context):
+            hits += 1
+
+        if model:
+            t0 = time.perf_counter()
+            run_study_llm(model=model, mode="qa", context=context, question=item["question"])
+            llm_s.append(time.perf_counter() - t0)
+
+    out = {
+        "top_k": top_k,
+        "rerank": rerank,
+        "hit_rate": hits / len(labels),
+        "retrieval_ms_p50": statistics.median(retrieval_s) * 1000,
+        "context_chars_mean": statistics.mean(ctx_chars),
+    }
+    if llm_s:
+        out["llm_s_p50"] = statistics.median(llm_s)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--notes", required=True)
+    ap.add_argument("--labels", required=True)
+    ap.add_argument("--baseline-k", type=int, default=8)
+    ap.add_argument("--rerank-k", type=int, default=3)
+    ap.add_argument("--candidates", type=int, default=20)
+    ap.add_argument("--model", default=None, help="Also time the LLM call with this Ollama model")
+    args = ap.parse_args()
+
+    with open(args.notes, encoding="utf-8") as f:
+        notes_text = clean_text(f.read())
+    with open(args.labels, encoding="utf-8") as f:
+        labels = [json.loads(line) for line in f if line.strip()]
+
+    with scratch_store():  # never index into the app's store
+        index_notes(notes_text)
+        # warm embedder + cross-encoder so model loading isn't counted
+        retrieve_sources(notes_text=notes_text, question="warmup", top_k=1, rerank=True, candidates=2)
+
+        rows = [
+            _measure(notes_text, labels, args.baseline_k, False, args.candidates, args.model),
+            _measure(notes_text, labels, args.rerank_k, True, args.candidates, args.model),
+        ]
+
+    for r in rows:
+        name = f"rerank {args.candidates}->{r['top_k']}" if r["rerank"] else f"top-{r['top_k']}"
+        line = (f"{name:<16} hit_rate={r['hit_rate']:.2f}  retrieval p50={r['retrieval_ms_p50']:.1f} ms  "
+                f"context={r['context_chars_mean']:.0f} chars")
+        if "llm_s_p50" in r:
+            line += f"  llm p50={r['llm_s_p50']:.2f} s"
+        print(line)
+
+    if "llm_s_p50" in rows[0]:
+        saved = (rows[0]["llm_s_p50"] + rows[0]["retrieval_ms_p50"] / 1000) - (rows[1]["llm_s_p50"] + rows[1]["retrieval_ms_p50"] / 1000)
+        print(f"end-to-end p50 saved per question: {saved:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compact vector benchmark: memory per million chunks and recall loss vs float32.
+
+Builds a clustered synthetic corpus (or embeds real chunks with --notes), stores
+it with vector_store.CompactStore as float16 and int8, and compares top-k
+against exact float32 search. "int8+rescore" rescores the top candidates from
+the float32 sidecar the way rag does with STUDY_VECTOR_RESCORE (its MB column
+includes the sidecar). With --notes, "int8+re-embed" times the fallback for
+documents without a sidecar: re-embedding candidate text with rag._embed.
+
+Usage:
+  python -m benchmarks.bench_vectors --n 200000 --queries 200 --k 5
+  python -m benchmarks.bench_vectors --notes notes.txt --k 5
+"""
+from __future__ import annotations
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from vector_store import CompactStore
+
+DIM = 384  # all-MiniLM-L6-v2
+
+
+def _synthetic(n: int, n_queries: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, n // 500), DIM)).astype(np.float32)
+    x = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.normal(size=(n, DIM)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    q = x[rng.integers(0, n, n_queries)] + 0.3 * rng.normal(size=(n_queries, DIM)).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return x, q
+
+
+def _from_notes(path: str) -> tuple[np.ndarray, np.ndarray, list]:
+    from extract import clean_text
+    from rag import _chunk_text, _embed
+
+    with open(path, encoding="utf-8") as f:
+        chunks = _chunk_text(clean_text(f.read()))
+    # one query per chunk: its first line, which the chunk should retrieve
+    queries = [c.split("\n", 1)[0][:200] for c in chunks]
+    return np.asarray(_embed(chunks), dtype=np.float32), np.asarray(_embed(queries), dtype=np.float32), chunks
+
+
+def _recall(found: list[set], truth: list[set]) -> float:
+    return float(np.mean([len(f & t) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=100000, help="Synthetic corpus size")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--rescore", type=int, default=20)
+    ap.add_argument("--notes", default=None, help="Embed real chunks from this text file instead")
+    args = ap.parse_args()
+
+    if args.notes:
+        x, q, texts = _from_notes(args.notes)
+    else:
+        (x, q), texts = _synthetic(args.n, args.queries), None
+    n = x.shape[0]
+    chunks = texts or [str(i) for i in range(n)]
+    metas = [{"notes_hash": "bench", "chunk_id": i} for i in range(n)]
+
+    exact_scores = q @ x.T
+    truth = [set(np.argsort(-row)[: args.k].tolist()) for row in exact_scores]
+
+    print(f"corpus={n} x {x.shape[1]}  queries={len(q)}  k={args.k}")
+    print(f"{'mode':<14} {'MB / 1M chunks':>15} {'file MB':>9} {'recall@k':>9} {'query ms':>9}")
+    print(f"{'float32':<14} {x.itemsize * x.shape[1] * 1e6 / 1e6:>15.0f} {x.nbytes / 1e6:>9.1f} {1.0:>9.3f} {'-':>9}")
+
+    configs = [("float16", "float16", 0, False), ("int8", "int8", 0, False)]
+    if args.rescore:
+        configs.append(("int8+rescore", "int8", args.rescore, True))
+        if texts:
+            configs.append(("int8+re-embed", "int8", args.rescore, False))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, dtype, rescore, keep_float32 in configs:
+            store = CompactStore(os.path.join(tmp, name), dtype=dtype, keep_float32=keep_float32)
+            store.add("bench", chunks, x, metas)
+            size = sum(os.path.getsize(os.path.join(store.path, f)) for f in os.listdir(store.path)
+                       if f.endswith(".npy"))
+            embed_fn = None
+            if rescore and not keep_float32:
+                from rag import _embed as embed_fn
+
+            found = []
+            t0 = time.perf_counter()
+            for qv in q:
+                hits = store.query(qv, top_k=args.k, notes_hash="bench", rescore=rescore, embed_fn=embed_fn)
+                found.append({h["metadata"]["chunk_id"] for h in hits})
+            ms = (time.perf_counter() - t0) * 1000 / len(q)
+            print(f"{name:<14} {size / n * 1e6 / 1e6:>15.0f} {size / 1e6:>9.1f} {_recall(found, truth):>9.3f} {ms:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Offline retrieval evaluation: recall@k, MRR, context tokens and latency.
+
+Notes are indexed through rag.index_notes (once per chunk_size/overlap setting)
+and every question goes through rag.retrieve_sources. A retrieved chunk counts
+as relevant when its character range overlaps the labeled supporting span, so
+results are comparable across chunkers. Per (setting, k) it reports:
+  - recall@k:   share of questions with a relevant chunk in the top k
+  - coverage@k: mean share of the span's characters inside the top k chunks
+  - MRR@k:      mean 1/rank of the first relevant chunk (0 if below k)
+  - tokens@k:   mean context tokens sent to the LLM (chars / 4)
+  - latency:    retrieve_sources p50 / p95 per query (ms)
+
+Labels file: JSONL with {"question": "...", "span": "verbatim text from the notes"}
+(the same format as bench_rerank). Without --labels, --synthetic N pairs are
+made from random sentences of the notes, with a keyword question per sentence.
+
+Each run is saved as JSON under --runs-dir; compare two runs with --compare.
+The eval runs against its own store directory (--persist-dir, default
+chroma_db_eval: collection, compact files and access log), removed afterwards
+unless --keep; the app's chroma_db/ and its artifacts are never touched.
+
+Usage:
+  python -m benchmarks.eval_retrieval --notes notes.txt --labels labels.jsonl \
+      --top-k 1,3,5,8 --chunk-size 600,900 --overlap 150 --name baseline
+  python -m benchmarks.eval_retrieval --notes notes.txt --synthetic 100 --rerank --name rerank
+  python -m benchmarks.eval_retrieval --compare eval_runs/a.json eval_runs/b.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import time
+
+import rag
+from chat import approx_tokens
+from extract import clean_text
+
+RUNS_DIR = "eval_runs"
+EVAL_PERSIST_DIR = "chroma_db_eval"
+EVAL_COLLECTION = "study_notes_eval"
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z-]{3,}")
+_STOPWORDS = {
+    "this", "that", "with", "from", "they", "them", "their", "there", "which", "when", "where",
+    "what", "have", "has", "been", "were", "will", "would", "also", "into", "than", "then",
+    "these", "those", "such", "some", "more", "most", "very", "each", "other", "about",
+}
+
+
+def _pct(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def _ints(s: str) -> list[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+# ---------- labels ----------
+
+def synthetic_labels(notes_text: str, n: int, seed: int = 0) -> list[dict]:
+    """
+    (question, span) pairs from random sentences: the span is the sentence, the
+    question asks about its longest content words, so it is not a verbatim copy.
+    """
+    sentences = [s.strip() for s in _SENTENCE_RE.split(notes_text.replace("\n", " "))]
+    sentences = [s for s in sentences if len(s.split()) >= 8]
+    rnd = random.Random(seed)
+    out = []
+    for span in rnd.sample(sentences, min(n, len(sentences))):
+        words = list(dict.fromkeys(w.lower() for w in _WORD_RE.findall(span) if w.lower() not in _STOPWORDS))
+        keywords = sorted(words, key=len, reverse=True)[:4]
+        rnd.shuffle(keywords)
+        out.append({"question": f"What do the notes say about {', '.join(keywords)}?", "span": span})
+    return out
+
+
+def locate_span(notes_text: str, span: str) -> tuple[int, int] | None:
+    """
+    Character range of span in notes_text, tolerant to whitespace differences.
+    """
+    start = notes_text.find(span)
+    if start >= 0:
+        return start, start + len(span)
+    words = span.split()
+    if not words:
+        return None
+    m = re.search(r"\s+".join(map(re.escape, words)), notes_text)
+    return (m.start(), m.end()) if m else None
+
+
+# ---------- evaluation ----------
+
+def evaluate(notes_text: str, labels: list[dict], ks: list[int], chunk_size: int, overlap: int,
+             rerank: bool = False, candidates: int | None = None) -> dict:
+    t0 = time.perf_counter()
+    notes_hash = rag.index_notes(notes_text, chunk_size=chunk_size, overlap=overlap)
+    index_s = time.perf_counter() - t0
+    rag._INDEXED_HASH = notes_hash  # retrieve_sources must not re-index with the default chunker
+    chunk_spans = rag._chunk_spans(notes_text, chunk_size, overlap)
+
+    # warm embedder (+ cross-encoder) so model loading isn't counted
+    rag.retrieve_sources(notes_text, "warmup", top_k=1, rerank=rerank, candidates=candidates)
+
+    max_k = max(ks)
+    queries = []
+    for item in labels:
+        loc = locate_span(notes_text, item["span"])
+        if loc is None:
+            continue
+        s, e = loc
+
+        t0 = time.perf_counter()
+        retr = rag.retrieve_sources(notes_text, item["question"], top_k=max_k, rerank=rerank, candidates=candidates)
+        latency = time.perf_counter() - t0
+
+        ids = [src.get("chunk_id") for src in retr["sources"]]
+        ranges = [chunk_spans[i] for i in ids if i is not None and i < len(chunk_spans)]
+        first = next((r + 1 for r, (a, b) in enumerate(ranges) if a < e and b > s), None)
+
+        per_k = {}
+        for k in ks:
+            covered = set()
+            for a, b in ranges[:k]:
+                covered.update(range(max(a, s), min(b, e)))
+            context = "\n\n---\n\n".join(src["chunk"] for src in retr["sources"][:k])
+            per_k[k] = {
+                "hit": first is not None and first <= k,
+                "coverage": len(covered) / max(1, e - s),
+                "rr": 1.0 / first if first is not None and first <= k else 0.0,
+                "tokens": approx_tokens(context),
+            }
+        queries.append({"question": item["question"], "first_relevant_rank": first,
+                        "latency_ms": latency * 1000, "per_k": per_k})
+
+    latencies = [q["latency_ms"] for q in queries]
+    by_k = {}
+    for k in ks:
+        rows = [q["per_k"][k] for q in queries]
+        by_k[str(k)] = {
+            "recall": statistics.mean(r["hit"] for r in rows) if rows else 0.0,
+            "coverage": statistics.mean(r["coverage"] for r in rows) if rows else 0.0,
+            "mrr": statistics.mean(r["rr"] for r in rows) if rows else 0.0,
+            "tokens_mean": statistics.mean(r["tokens"] for r in rows) if rows else 0.0,
+        }
+
+    return {
+        "config": {"chunk_size": chunk_size, "overlap": overlap, "rerank": rerank, "candidates": candidates},
+        "chunks": len(chunk_spans),
+        "index_s": index_s,
+        "questions": len(queries),
+        "unlocated": len(labels) - len(queries),
+        "latency_ms": {"p50": _pct(latencies, 50), "p95": _pct(latencies, 95)},
+        "by_k": by_k,
+        "queries": queries,
+    }
+
+
+def _config_name(cfg: dict) -> str:
+    name = f"chunk={cfg['chunk_size']}/{cfg['overlap']}"
+    if cfg.get("rerank"):
+        name += f" rerank({cfg.get('candidates') or 'default'})"
+    return name
+
+
+def print_results(results: list[dict], target_recall: float) -> None:
+    print(f"{'config':<28} {'k':>3} {'recall':>7} {'cover':>6} {'MRR':>6} {'tokens':>7} {'p50 ms':>7} {'p95 ms':>7}")
+    best = None
+    for r in results:
+        name = _config_name(r["config"])
+        for k, m in r["by_k"].items():
+            print(f"{name:<28} {k:>3} {m['recall']:>7.3f} {m['coverage']:>6.3f} {m['mrr']:>6.3f} "
+                  f"{m['tokens_mean']:>7.0f} {r['latency_ms']['p50'] or 0:>7.1f} {r['latency_ms']['p95'] or 0:>7.1f}")
+            if m["recall"] >= target_recall and (best is None or m["tokens_mean"] < best[2]):
+                best = (name, k, m["tokens_mean"], m["recall"])
+        if r["unlocated"]:
+            print(f"  ({r['unlocated']} labeled spans not found in the notes were skipped)")
+    if best:
+        print(f"smallest prompt with recall >= {target_recall:.2f}: {best[0]} k={best[1]} "
+              f"(~{best[2]:.0f} tokens, recall {best[3]:.3f})")
+    else:
+        print(f"no setting reached recall {target_recall:.2f}")
+
+
+def compare(path_a: str, path_b: str) -> None:
+    runs = []
+    for path in (path_a, path_b):
+        with open(path, encoding="utf-8") as f:
+            runs.append(json.load(f))
+    a, b = ({(_config_name(r["config"]), k): (m, r) for r in run["results"] for k, m in r["by_k"].items()} for run in runs)
+
+    print(f"A: {path_a} ({runs[0]['meta'].get('name')})")
+    print(f"B: {path_b} ({runs[1]['meta'].get('name')})")
+    print(f"{'config':<28} {'k':>3} {'recall A':>8} {'B':>6} {'MRR A':>6} {'B':>6} {'tokens A':>8} {'B':>6} {'p50 A':>7} {'B':>7}")
+    for key in sorted(set(a) | set(b), key=lambda x: (x[0], int(x[1]))):
+        (ma, ra), (mb, rb) = a.get(key, (None, None)), b.get(key, (None, None))
+
+        def cell(m, field, fmt):
+            return format(m[field], fmt) if m else "-"
+
+        def lat(r):
+            return format(r["latency_ms"]["p50"] or 0, ".1f") if r else "-"
+
+        print(f"{key[0]:<28} {key[1]:>3} {cell(ma, 'recall', '.3f'):>8} {cell(mb, 'recall', '.3f'):>6} "
+              f"{cell(ma, 'mrr', '.3f'):>6} {cell(mb, 'mrr', '.3f'):>6} {cell(ma, 'tokens_mean', '.0f'):>8} "
+              f"{cell(mb, 'tokens_mean', '.0f'):>6} {lat(ra):>7} {lat(rb):>7}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--notes", help="Text file with the notes")
+    ap.add_argument("--labels", help="JSONL of {question, span}")
+    ap.add_argument("--synthetic", type=int, default=50, help="Generated pairs when --labels is not given")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--top-k", default="1,3,5,8")
+    ap.add_argument("--chunk-size", default=str(rag.CHUNK_SIZE), help="Comma-separated values to sweep")
+    ap.add_argument("--overlap", default=str(rag.CHUNK_OVERLAP), help="Comma-separated values to sweep")
+    ap.add_argument("--rerank", action="store_true", help="Retrieve with cross-encoder rerank")
+    ap.add_argument("--candidates", type=int, default=None)
+    ap.add_argument("--embed-model", default=None, help=f"Override {rag.EMBED_MODEL_NAME}")
+    ap.add_argument("--target-recall", type=float, default=0.9)
+    ap.add_argument("--name", default=None, help="Label stored with the run")
+    ap.add_argument("--runs-dir", default=RUNS_DIR)
+    ap.add_argument("--persist-dir", default=EVAL_PERSIST_DIR, help="Store directory for the eval index")
+    ap.add_argument("--keep", action="store_true", help="Keep the eval index afterwards")
+    ap.add_argument("--compare", nargs=2, metavar=("RUN_A", "RUN_B"))
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not args.notes:
+        ap.error("--notes is required unless --compare is given")
+
+    # own store dir (index_notes also records access there), and a collection /
+    # compact dir per embedder since dimensions may differ
+    if os.path.abspath(args.persist_dir) == os.path.abspath(rag.PERSIST_DIR):
+        ap.error(f"--persist-dir must not be the app's store ({rag.PERSIST_DIR})")
+    created_dir = not os.path.exists(args.persist_dir)
+    rag.PERSIST_DIR = args.persist_dir
+    suffix = ""
+    if args.embed_model:
+        rag.EMBED_MODEL_NAME = args.embed_model
+        suffix = "_" + re.sub(r"[^A-Za-z0-9]+", "_", args.embed_model.split("/")[-1]).strip("_")
+    rag.COLLECTION_NAME = EVAL_COLLECTION + suffix
+    rag.COMPACT_DIR = os.path.join(rag.PERSIST_DIR, "compact" + suffix)
+
+    with open(args.notes, encoding="utf-8") as f:
+        notes_text = clean_text(f.read())
+    if args.labels:
+        with open(args.labels, encoding="utf-8") as f:
+            labels = [json.loads(line) for line in f if line.strip()]
+    else:
+        labels = synthetic_labels(notes_text, args.synthetic, seed=args.seed)
+    if not labels:
+        raise SystemExit("No labeled questions to evaluate.")
+
+    ks = sorted(set(_ints(args.top_k)))
+    results = []
+    try:
+        for chunk_size in _ints(args.chunk_size):
+            for overlap in _ints(args.overlap):
+                if overlap >= chunk_size:
+                    continue
+                print(f"Evaluating chunk_size={chunk_size} overlap={overlap} on {len(labels)} questions...", flush=True)
+                results.append(evaluate(notes_text, labels, ks, chunk_size, overlap,
+                                        rerank=args.rerank, candidates=args.candidates))
+    finally:
+        if not args.keep:
+            if created_dir:
+                shutil.rmtree(args.persist_dir, ignore_errors=True)
+            elif rag.VECTOR_MODE == "chroma":
+                rag._get_client().delete_collection(rag.read_collection_pointer()["active"])
+            else:
+                rag.get_compact_store().delete(rag.compute_notes_hash(notes_text))
+
+    print_results(results, args.target_recall)
+
+    meta = {
+        "name": args.name,
+        "created_at": time.time(),
+        "notes": os.path.abspath(args.notes),
+        "notes_hash": rag.compute_notes_hash(notes_text),
+        "labels": os.path.abspath(args.labels) if args.labels else f"synthetic:{args.synthetic}:seed{args.seed}",
+        "embed_model": rag.EMBED_MODEL_NAME,
+        "vector_mode": rag.VECTOR_MODE,
+        "compact_rescore": rag.COMPACT_RESCORE,
+    }
+    os.makedirs(args.runs_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(args.runs_dir, f"{stamp}_{re.sub(r'[^A-Za-z0-9_-]+', '_', args.name or 'run')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+    print(f"run saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
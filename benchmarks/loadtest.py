@@ -0,0 +1,265 @@
+"""
+Load test: N simulated Streamlit sessions driving index_only + answer_question.
+
+Each session indexes its notes once, then loops: think -> pick a mode (qa/notes/mcq
+by weight) -> answer_question. The Ollama call is replaced by a stub with
+configurable latency and a fixed number of parallel slots (like
+OLLAMA_NUM_PARALLEL), so extraction, embedding, Chroma and the pipeline are
+exercised for real while the LLM is predictable. Time spent waiting for a
+slot is reported as queueing. Everything is indexed into a temporary store
+(benchmarks.scratch_store), never the app's chroma_db/.
+
+Steps through each --sessions value to find the saturation point, e.g.:
+  python -m benchmarks.loadtest --notes notes.txt --sessions 1,2,4,8,16 --duration 60 \
+      --llm-latency 2.0 --llm-slots 2 --think 5 --mix qa=6,notes=2,mcq=2 --out load.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import ollama_client
+from benchmarks.scratch_store import scratch_store
+from pipeline import answer_question, index_only
+
+QUESTIONS = [
+    "Summarize the main idea.",
+    "What are the key definitions?",
+    "Explain the most important process described.",
+    "What are common mistakes students make here?",
+    "List the key facts to remember.",
+]
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3  # peak, KB on Linux
+
+
+def _pct(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class StubLLM:
+    """
+    Drop-in for ollama_chat: waits for one of `slots`, sleeps, returns valid JSON for the schema asked.
+    """
+
+    def __init__(self, latency_s: float, per_kchar_s: float, jitter: float, slots: int):
+        self.latency_s = latency_s
+        self.per_kchar_s = per_kchar_s
+        self.jitter = jitter
+        self.slots = threading.Semaphore(slots)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.queue_waits: list[float] = []
+
+    def __call__(self, model, messages=None, *, system=None, prompt=None, format=None, **_):
+        if messages is not None:
+            system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+            prompt = "\n".join(m["content"] for m in messages if m["role"] != "system")
+        with self.lock:
+            self.waiting += 1
+        t0 = time.perf_counter()
+        with self.slots:
+            wait = time.perf_counter() - t0
+            with self.lock:
+                self.waiting -= 1
+                self.queue_waits.append(wait)
+            chars = len(prompt or "") + len(system or "")
+            delay = self.latency_s + self.per_kchar_s * chars / 1000
+            time.sleep(max(0.0, delay * random.uniform(1 - self.jitter, 1 + self.jitter)))
+        return json.dumps(self._response(format, prompt or ""))
+
+    def api(self, model, messages, *, format=None, options=None, keep_alive=None, timeout_s=None) -> dict:
+        """Drop-in for ollama_chat_api (StudySession); timings are not simulated."""
+        return {"content": self(model, messages, format=format), "prompt_eval_count": None,
+                "prompt_eval_duration": None, "eval_count": None, "eval_duration": None, "total_duration": None}
+
+    @staticmethod
+    def _response(fmt, prompt: str) -> dict:
+        props = (fmt or {}).get("properties", {})
+        mcq = {"q": "Stub question?", "options": ["A) a", "B) b", "C) c", "D) d"],
+               "answer": "A", "explanation": "stub", "evidence": ["stub"]}
+        if "q" in props:
+            return mcq
+        mode = (props.get("mode", {}).get("enum") or [None])[0]
+        if mode == "mcq" or (mode is None and "MCQs" in prompt):
+            return {"mode": "mcq", "topic": "stub", "mcqs": [mcq] * 5, "missing": None}
+        if mode == "notes" or (mode is None and "revision notes" in prompt):
+            return {"mode": "notes", "topic": "stub", "revision_notes": ["stub"], "definitions": [],
+                    "common_mistakes": [], "evidence": ["stub"], "missing": None}
+        return {"mode": "qa", "answer": "stub", "key_points": [], "evidence": ["stub"], "missing": None}
+
+
+def install_stub(stub: StubLLM) -> list[str]:
+    """
+    Replaces ollama_chat / ollama_chat_api everywhere they were imported
+    (llm_runner, router incl. model="auto" and fan-out routing, chat rewrites,
+    StudySession), so no path reaches a real Ollama. Returns the patched names.
+    """
+    originals = {ollama_client.ollama_chat: stub, ollama_client.ollama_chat_api: stub.api}
+    patched = []
+    for name, module in list(sys.modules.items()):
+        for attr in ("ollama_chat", "ollama_chat_api"):
+            fn = getattr(module, attr, None)
+            if fn in originals:
+                setattr(module, attr, originals[fn])
+                patched.append(f"{name}.{attr}")
+    return patched
+
+
+def run_step(notes: list[str], n_sessions: int, duration_s: float, think_s: float,
+             mix: dict, top_k: int, stub: StubLLM, sample_s: float) -> dict:
+    stop = threading.Event()
+    lock = threading.Lock()
+    records: list[dict] = []
+    timeline: list[dict] = []
+    inflight = [0]
+    waits_before = len(stub.queue_waits)
+    modes, weights = zip(*mix.items())
+
+    def session(i: int):
+        rnd = random.Random(i)
+        text = notes[i % len(notes)]
+        t0 = time.perf_counter()
+        try:
+            index_only(uploaded_file=None, pasted_text=text)
+            with lock:
+                records.append({"kind": "index", "latency": time.perf_counter() - t0, "ok": True})
+        except Exception as e:
+            with lock:
+                records.append({"kind": "index", "latency": time.perf_counter() - t0, "ok": False, "error": str(e)})
+            return
+
+        while not stop.is_set():
+            if stop.wait(rnd.expovariate(1 / think_s) if think_s > 0 else 0):
+                break
+            mode = rnd.choices(modes, weights)[0]
+            with lock:
+                inflight[0] += 1
+            t0 = time.perf_counter()
+            ok, err = True, None
+            try:
+                answer_question(uploaded_file=None, pasted_text=text, question=rnd.choice(QUESTIONS),
+                                mode=mode, top_k=top_k)
+            except Exception as e:
+                ok, err = False, str(e)
+            with lock:
+                inflight[0] -= 1
+                records.append({"kind": mode, "latency": time.perf_counter() - t0, "ok": ok, "error": err,
+                                "done_at": time.perf_counter()})
+
+    def sampler(start: float):
+        while not stop.wait(sample_s):
+            with lock, stub.lock:
+                timeline.append({"t": round(time.perf_counter() - start, 2), "rss_mb": round(_rss_mb(), 1),
+                                 "inflight": inflight[0], "llm_queue": stub.waiting})
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(i,), daemon=True) for i in range(n_sessions)]
+    mon = threading.Thread(target=sampler, args=(start,), daemon=True)
+    mon.start()
+    for t in threads:
+        t.start()
+    time.sleep(duration_s)
+    stop.set()
+    for t in threads:
+        t.join()
+    mon.join()
+    elapsed = time.perf_counter() - start
+
+    asks = [r for r in records if r["kind"] != "index"]
+    in_window = [r for r in asks if r["ok"] and r["done_at"] - start <= duration_s]
+    by_mode = {}
+    for mode in modes:
+        lat = [r["latency"] for r in asks if r["kind"] == mode and r["ok"]]
+        by_mode[mode] = {"n": len(lat), "p50": _pct(lat, 50), "p90": _pct(lat, 90), "p99": _pct(lat, 99)}
+    waits = stub.queue_waits[waits_before:]
+    lat_all = [r["latency"] for r in asks if r["ok"]]
+
+    return {
+        "sessions": n_sessions,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(in_window) / duration_s,
+        "requests": len(asks),
+        "errors": sum(1 for r in records if not r["ok"]),
+        "error_samples": list({r["error"] for r in records if not r["ok"]})[:5],
+        "latency": {"p50": _pct(lat_all, 50), "p90": _pct(lat_all, 90), "p99": _pct(lat_all, 99)},
+        "by_mode": by_mode,
+        "index_latency_p50": _pct([r["latency"] for r in records if r["kind"] == "index" and r["ok"]], 50),
+        "llm_queue_wait": {"p50": _pct(waits, 50), "p99": _pct(waits, 99),
+                           "max_depth": max((s["llm_queue"] for s in timeline), default=0)},
+        "rss_mb": {"start": timeline[0]["rss_mb"] if timeline else None,
+                   "max": max((s["rss_mb"] for s in timeline), default=None)},
+        "timeline": timeline,
+    }
+
+
+def _fmt(v) -> str:
+    return f"{v:.2f}" if isinstance(v, (int, float)) else "-"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--notes", action="append", required=True,
+                    help="Text file(s) with notes; sessions are assigned round-robin")
+    ap.add_argument("--sessions", default="1,2,4,8")
+    ap.add_argument("--duration", type=float, default=30, help="Seconds per step")
+    ap.add_argument("--think", type=float, default=3.0, help="Mean think time between asks (s)")
+    ap.add_argument("--mix", default="qa=6,notes=2,mcq=2")
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--llm-latency", type=float, default=1.5, help="Stub LLM base latency (s)")
+    ap.add_argument("--llm-per-kchar", type=float, default=0.05, help="Extra stub latency per 1k prompt chars (s)")
+    ap.add_argument("--llm-jitter", type=float, default=0.2)
+    ap.add_argument("--llm-slots", type=int, default=1, help="Parallel generations the stub serves")
+    ap.add_argument("--sample", type=float, default=1.0, help="Memory / queue sampling interval (s)")
+    ap.add_argument("--out", default=None, help="Write the full report (with timelines) as JSON")
+    args = ap.parse_args()
+
+    notes = []
+    for path in args.notes:
+        with open(path, encoding="utf-8") as f:
+            notes.append(f.read())
+    mix = {k: float(v) for k, v in (p.split("=") for p in args.mix.split(","))}
+
+    stub = StubLLM(args.llm_latency, args.llm_per_kchar, args.llm_jitter, args.llm_slots)
+    install_stub(stub)  # the LLM is the only stubbed stage
+
+    steps = []
+    print(f"{'sessions':>8} {'rps':>6} {'p50 s':>7} {'p90 s':>7} {'p99 s':>7} {'queue p99':>9} {'errors':>6} {'rss max MB':>10}")
+    with scratch_store():  # sessions index into a throwaway store, not the app's
+        for n in [int(x) for x in args.sessions.split(",")]:
+            r = run_step(notes, n, args.duration, args.think, mix, args.top_k, stub, args.sample)
+            steps.append(r)
+            print(f"{n:>8} {r['throughput_rps']:>6.2f} {_fmt(r['latency']['p50']):>7} {_fmt(r['latency']['p90']):>7} "
+                  f"{_fmt(r['latency']['p99']):>7} {_fmt(r['llm_queue_wait']['p99']):>9} {r['errors']:>6} "
+                  f"{_fmt(r['rss_mb']['max']):>10}")
+            for err in r["error_samples"]:
+                print(f"         error: {err[:120]}")
+
+    # saturation: first step where adding sessions no longer adds >=10% throughput
+    for prev, cur in zip(steps, steps[1:]):
+        if cur["throughput_rps"] < prev["throughput_rps"] * 1.1:
+            print(f"saturation around {prev['sessions']} sessions ({prev['throughput_rps']:.2f} req/s)")
+            break
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "steps": steps}, f, indent=1)
+        print(f"report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
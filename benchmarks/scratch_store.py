@@ -0,0 +1,41 @@
+"""
+Throwaway store for benchmarks, so they never index into the app's chroma_db/
+or record accesses in its notes_access.json (which gc() would then act on).
+"""
+from __future__ import annotations
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import artifacts
+import maintenance
+import rag
+
+SCRATCH_COLLECTION = "study_notes_bench"
+
+
+@contextmanager
+def scratch_store(prefix: str = "chroma_db_bench_"):
+    """
+    Points rag (and the access log / artifacts that live under its store dir)
+    at a fresh temporary directory and removes it afterwards.
+    """
+    saved = (rag.PERSIST_DIR, rag.COLLECTION_NAME, rag.COMPACT_DIR, rag._INDEXED_HASH, artifacts.ARTIFACTS_DIR)
+    path = tempfile.mkdtemp(prefix=prefix)
+    rag.PERSIST_DIR = path
+    rag.COLLECTION_NAME = SCRATCH_COLLECTION
+    rag.COMPACT_DIR = os.path.join(path, "compact")
+    rag._INDEXED_HASH = None
+    rag.get_compact_store.cache_clear()
+    artifacts.ARTIFACTS_DIR = os.path.join(path, "artifacts")
+    with maintenance._LOCK:
+        maintenance._ACCESS = None
+    try:
+        yield path
+    finally:
+        rag.PERSIST_DIR, rag.COLLECTION_NAME, rag.COMPACT_DIR, rag._INDEXED_HASH, artifacts.ARTIFACTS_DIR = saved
+        rag.get_compact_store.cache_clear()
+        with maintenance._LOCK:
+            maintenance._ACCESS = None
+        shutil.rmtree(path, ignore_errors=True)
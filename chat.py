@@ -0,0 +1,163 @@
+# chat.py
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import Dict, List, Optional
+
+from llm_prompts import REWRITE_PROMPT
+from ollama_client import ollama_chat
+
+# Per-turn budgets. Token counts are estimated as chars / 4 (close enough for MiniLM/Mistral English text).
+CHAT_RECENT_TURNS = 3         # turns kept (compressed) verbatim-ish
+CHAT_HISTORY_TOKENS = 400     # summary + recent turns
+CHAT_CONTEXT_CHARS = 6000     # retrieved chunks sent to the LLM
+CHAT_REUSE_CHUNKS = 2         # previous top chunks carried into a follow-up
+
+CHAT_REUSE_SHARE = 0.34        # at most this share of CHAT_CONTEXT_CHARS goes to carried chunks
+
+# A follow-up starts with a pronoun or a reference to the previous answer
+# ("What about its structure?", "Explain that again", "And the second one?"),
+# possibly after a few leading words; a mention further into a longer
+# question ("Name the first stage of mitosis") is not one.
+_FOLLOWUP_RE = re.compile(
+    r"^\W*(?:(?:and|but|so|also|then|ok|okay|what|why|how|who|when|where|which|is|are|was|were|"
+    r"does|do|did|can|could|would|of|explain|describe)\s+){0,3}"
+    r"(?:it|its|this|that|these|those|they|them|their|he|she|his|her|"
+    r"the\s+(?:above|previous|former|latter|same|(?:first|second|third|last)\s+(?:one|point|part)))\b"
+    r"|^\W*(?:(?:what|how)\s+about|and|tell\s+me\s+more|more\s+on|elaborate|expand\s+on|go\s+on)\b",
+    re.IGNORECASE,
+)
+
+
+def approx_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+class ChatSession:
+    """
+    Conversation state for follow-up questions on one set of notes.
+
+    Keeps the last few turns (each compressed to question + first sentence of the
+    answer) and folds older turns into a bounded running summary, so the
+    history sent with each prompt stays under CHAT_HISTORY_TOKENS no matter how
+    long the conversation gets.
+    """
+
+    def __init__(
+        self,
+        notes_hash: Optional[str] = None,
+        recent_turns: int = CHAT_RECENT_TURNS,
+        history_tokens: int = CHAT_HISTORY_TOKENS,
+        context_chars: int = CHAT_CONTEXT_CHARS,
+    ):
+        self.notes_hash = notes_hash
+        self.history_tokens = history_tokens
+        self.context_chars = context_chars
+        self.turns: deque = deque(maxlen=recent_turns)
+        self.summary: List[str] = []
+        self.last_sources: List[Dict] = []
+        self.turn_count = 0
+
+    # ---------- history ----------
+
+    def history_text(self) -> str:
+        lines = []
+        if self.summary:
+            lines.append("Earlier: " + " | ".join(self.summary))
+        for t in self.turns:
+            lines.append(f"Q: {t['question']}")
+            lines.append(f"A: {t['answer']}")
+        return "\n".join(lines)
+
+    def add_turn(self, question: str, result: Dict, sources: List[Dict]) -> None:
+        if len(self.turns) == self.turns.maxlen:
+            oldest = self.turns[0]
+            self.summary.append(_shorten(oldest["question"], 80))
+
+        self.turns.append({
+            "question": _shorten(question, 200),
+            "answer": _shorten(_first_sentence(result.get("answer") or ""), 240),
+        })
+        self.last_sources = list(sources)
+        self.turn_count += 1
+
+        # keep the whole history inside budget: drop oldest summary items first, then old turns
+        while approx_tokens(self.history_text()) > self.history_tokens and (self.summary or len(self.turns) > 1):
+            if self.summary:
+                self.summary.pop(0)
+            else:
+                self.turns.popleft()
+
+    # ---------- retrieval ----------
+
+    def is_followup(self, question: str) -> bool:
+        if not self.turns:
+            return False
+        return bool(_FOLLOWUP_RE.search(question))
+
+    def rewrite_query(self, question: str, model: Optional[str] = None) -> str:
+        """
+        Turns a follow-up into a standalone retrieval query.
+        With a model, asks the LLM for the rewrite; otherwise (or on failure) it
+        prefixes the previous question so the embedding carries the topic.
+        """
+        question = question.strip()
+        if not self.is_followup(question):
+            return question
+
+        if model:
+            try:
+                raw = ollama_chat(
+                    model,
+                    prompt=REWRITE_PROMPT.format(history=self.history_text(), question=question),
+                    temperature=0.0,
+                    timeout_s=30,
+                    options={"num_predict": 64},
+                )
+                rewritten = raw.strip().splitlines()[0].strip().strip('"') if raw.strip() else ""
+                if rewritten:
+                    return rewritten
+            except Exception as e:
+                print(f"Chat: query rewrite failed, using heuristic: {e}", flush=True)
+
+        return f"{self.turns[-1]['question']} {question}"
+
+    def merge_sources(self, retrieved: List[Dict], followup: bool) -> List[Dict]:
+        """
+        For follow-ups, carries the previous turn's top chunks forward (the answer
+        being asked about came from them), then fills with newly retrieved chunks.
+        Carried chunks get at most CHAT_REUSE_SHARE of context_chars, so they
+        never crowd out the retrieved ones; total chunk text is capped at context_chars.
+        """
+        out: List[Dict] = []
+        seen = set()
+        used = 0
+
+        def take(sources: List[Dict], budget: int) -> None:
+            nonlocal used
+            for s in sources:
+                key = (s.get("notes_hash"), s.get("chunk_id"))
+                if key in seen:
+                    continue
+                size = len(s.get("chunk") or "")
+                if out and used + size > budget:
+                    break
+                seen.add(key)
+                out.append({**s, "rank": len(out) + 1})
+                used += size
+
+        if followup:
+            take(self.last_sources[:CHAT_REUSE_CHUNKS], int(self.context_chars * CHAT_REUSE_SHARE))
+        take(list(retrieved), self.context_chars)
+        return out
+
+def _first_sentence(text: str) -> str:
+    text = " ".join(text.split())
+    m = re.search(r"(.+?[.!?])(\s|$)", text)
+    return m.group(1) if m else text
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
@@ -0,0 +1,319 @@
+# export.py
+"""
+Result export: memoized per-result artifacts for the UI, plus streaming bulk export.
+
+Usage (bulk, from saved results — .json files or .jsonl):
+  python export.py --format csv --out quiz.csv results/*.json
+  python export.py --format jsonl --out all.jsonl results.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from typing import IO, Iterable, Iterator
+
+EXPORT_FORMATS = ("jsonl", "txt", "csv")
+EXPORT_CACHE_SIZE = 64
+BULK_EXPORT_CACHE_SIZE = 6  # two prepared bulk exports (jsonl + txt + csv each)
+
+# (result_id, fmt) -> bytes. Streamlit reruns the script on every interaction;
+# this keeps JSON/TXT downloads from being rebuilt each time.
+_EXPORT_CACHE: "OrderedDict[tuple, bytes]" = OrderedDict()
+# (result ids, fmt) -> bytes; kept apart so whole-history blobs don't evict per-result ones
+_BULK_CACHE: "OrderedDict[tuple, bytes]" = OrderedDict()
+_EXPORT_LOCK = threading.Lock()
+
+QUIZ_CSV_HEADER = ["result_id", "topic", "number", "question", "option_a", "option_b", "option_c", "option_d", "answer", "explanation", "evidence"]
+
+
+def result_id(result: dict) -> str:
+    """
+    Stable id for a result. Assigned once (pipeline sets it; older results get one lazily).
+    """
+    rid = result.get("result_id")
+    if not rid:
+        rid = uuid.uuid4().hex[:12]
+        result["result_id"] = rid
+    return rid
+
+
+def get_export_bytes(result: dict, fmt: str) -> bytes:
+    """
+    fmt: "json" (pretty, single result) | "txt". Memoized per result id.
+    """
+    key = (result_id(result), fmt)
+    with _EXPORT_LOCK:
+        data = _EXPORT_CACHE.get(key)
+        if data is not None:
+            _EXPORT_CACHE.move_to_end(key)
+            return data
+
+    if fmt == "json":
+        data = json.dumps(result, ensure_ascii=False, indent=2).encode("utf-8")
+    elif fmt == "txt":
+        data = build_export_text(result).encode("utf-8")
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    with _EXPORT_LOCK:
+        _EXPORT_CACHE[key] = data
+        while len(_EXPORT_CACHE) > EXPORT_CACHE_SIZE:
+            _EXPORT_CACHE.popitem(last=False)
+    return data
+
+
+def get_bulk_export_bytes(results: list[dict], fmt: str) -> bytes:
+    """
+    Bulk export of many results, memoized on the ordered list of result ids
+    in its own small cache.
+    """
+    key = (tuple(result_id(r) for r in results), fmt)
+    with _EXPORT_LOCK:
+        data = _BULK_CACHE.get(key)
+        if data is not None:
+            _BULK_CACHE.move_to_end(key)
+            return data
+
+    buf = io.StringIO()
+    write_results(results, buf, fmt)
+    data = buf.getvalue().encode("utf-8")
+
+    with _EXPORT_LOCK:
+        _BULK_CACHE[key] = data
+        while len(_BULK_CACHE) > BULK_EXPORT_CACHE_SIZE:
+            _BULK_CACHE.popitem(last=False)
+    return data
+
+
+# ---------- streaming writers ----------
+
+def iter_jsonl(results: Iterable[dict]) -> Iterator[str]:
+    for r in results:
+        result_id(r)
+        yield json.dumps(r, ensure_ascii=False) + "\n"
+
+
+def iter_txt(results: Iterable[dict]) -> Iterator[str]:
+    for i, r in enumerate(results):
+        if i:
+            yield "\n" + "=" * 60 + "\n\n"
+        yield build_export_text(r)
+        yield "\n"
+
+
+def iter_quiz_csv(results: Iterable[dict]) -> Iterator[str]:
+    """
+    One CSV row per MCQ across all mcq-mode results (other modes are skipped).
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def flush() -> str:
+        out = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return out
+
+    writer.writerow(QUIZ_CSV_HEADER)
+    yield flush()
+
+    for r in results:
+        if r.get("mode") != "mcq":
+            continue
+        rid = result_id(r)
+        for n, q in enumerate(r.get("mcqs") or [], start=1):
+            options = list(q.get("options") or [])[:4]
+            options += [""] * (4 - len(options))
+            writer.writerow([
+                rid,
+                r.get("topic", ""),
+                n,
+                q.get("q", ""),
+                *options,
+                q.get("answer", ""),
+                q.get("explanation", ""),
+                " | ".join(q.get("evidence") or []),
+            ])
+            yield flush()
+
+
+_WRITERS = {
+    "jsonl": iter_jsonl,
+    "txt": iter_txt,
+    "csv": iter_quiz_csv,
+}
+
+
+def write_results(results: Iterable[dict], fp: IO[str], fmt: str) -> int:
+    """
+    Streams results into a text file object one piece at a time.
+    Returns the number of characters written.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}. Use one of {EXPORT_FORMATS}")
+    written = 0
+    for piece in _WRITERS[fmt](results):
+        fp.write(piece)
+        written += len(piece)
+    return written
+
+
+def iter_result_files(paths: Iterable[str]) -> Iterator[dict]:
+    """
+    Reads results lazily from .json (one result) or .jsonl (one per line) files.
+    """
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                yield json.load(f)
+
+
+def build_export_text(result: dict) -> str:
+    mode = result.get("mode", "")
+    lines = []
+    lines.append("AI Study Assistant (RAG) — Export")
+    lines.append(f"Mode: {mode}")
+    lines.append("")
+
+    missing = result.get("missing")
+    if missing:
+        lines.append(f"Missing: {missing}")
+        lines.append("")
+
+    # QA
+    if mode == "qa":
+        lines.append("Answer:")
+        lines.append(result.get("answer", ""))
+        lines.append("")
+
+        kps = result.get("key_points", [])
+        if kps:
+            lines.append("Key Points:")
+            for kp in kps:
+                lines.append(f"- {kp}")
+            lines.append("")
+
+        ev = result.get("evidence", [])
+        if ev:
+            lines.append("Evidence (quotes from notes):")
+            for e in ev:
+                lines.append(f"- {e}")
+            lines.append("")
+
+    # NOTES
+    elif mode == "notes":
+        topic = result.get("topic")
+        if topic:
+            lines.append(f"Topic: {topic}")
+            lines.append("")
+
+        rn = result.get("revision_notes", [])
+        if rn:
+            lines.append("Revision Notes:")
+            for r in rn:
+                lines.append(f"- {r}")
+            lines.append("")
+
+        defs = result.get("definitions", [])
+        if defs:
+            lines.append("Definitions:")
+            for d in defs:
+                term = d.get("term", "")
+                definition = d.get("definition", "")
+                lines.append(f"- {term}: {definition}")
+            lines.append("")
+
+        cm = result.get("common_mistakes", [])
+        if cm:
+            lines.append("Common Mistakes:")
+            for m in cm:
+                lines.append(f"- {m}")
+            lines.append("")
+
+        ev = result.get("evidence", [])
+        if ev:
+            lines.append("Evidence (quotes from notes):")
+            for e in ev:
+                lines.append(f"- {e}")
+            lines.append("")
+
+    # MCQ
+    elif mode == "mcq":
+        topic = result.get("topic")
+        if topic:
+            lines.append(f"Topic: {topic}")
+            lines.append("")
+
+        mcqs = result.get("mcqs", [])
+        if mcqs:
+            lines.append("MCQs:")
+            for i, q in enumerate(mcqs, start=1):
+                lines.append(f"Q{i}. {q.get('q','')}")
+                for opt in q.get("options", []):
+                    lines.append(f"  {opt}")
+                lines.append(f"Answer: {q.get('answer','')}")
+                exp = q.get("explanation")
+                if exp:
+                    lines.append(f"Explanation: {exp}")
+                ev = q.get("evidence", [])
+                if ev:
+                    lines.append("Evidence:")
+                    for e in ev:
+                        lines.append(f"- {e}")
+                lines.append("")
+        else:
+            lines.append("No MCQs generated.")
+            lines.append("")
+
+    else:
+        lines.append("Unknown mode.")
+        lines.append("")
+
+    # Sources
+    sources = result.get("sources", [])
+    if sources:
+        lines.append("Sources (Top-k retrieved chunks):")
+        for s in sources:
+            rank = s.get("rank")
+            chunk_id = s.get("chunk_id")
+            dist = s.get("distance")
+            header = f"#{rank}"
+            if chunk_id is not None:
+                header += f" chunk_id={chunk_id}"
+            if dist is not None:
+                header += f" distance={dist}"
+            if s.get("source"):
+                header += f" source={s['source']} ({s.get('location', '')})"
+            lines.append(header)
+            chunk = (s.get("chunk") or "").strip()
+            lines.append(chunk)
+            lines.append("-" * 40)
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Bulk-export saved Study Assistant results.")
+    ap.add_argument("paths", nargs="+", help=".json or .jsonl result files")
+    ap.add_argument("--format", choices=EXPORT_FORMATS, default="jsonl")
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+
+    newline = "" if args.format == "csv" else None
+    with open(args.out, "w", encoding="utf-8", newline=newline) as fp:
+        n = write_results(iter_result_files(args.paths), fp, args.format)
+    print(f"Wrote {n} chars to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,387 @@
 from __future__ import annotations
-from typing import Optional
-from io import BytesIO
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from html.parser import HTMLParser
+from itertools import islice
+import mmap
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
 
 from pypdf import PdfReader
 from docx import Document
 
+SPOOL_CHUNK_SIZE = 1 << 20  # 1 MiB copy buffer when the upload has no getbuffer()
+EXTRACT_WORKERS = min(4, os.cpu_count() or 1)
+PDF_PAGES_PER_JOB = 50      # big PDFs are split into page ranges across workers
+SPLIT_MIN_BYTES = 2 << 20   # a lone upload smaller than this is not page-counted or split
+TEXT_LINES_PER_UNIT = 200   # plain text has no pages; emit units of this many lines
 
-def extract_text_from_uploaded_file(uploaded_file) -> str:
+# ---------- extractor registry ----------
+#
+# An extractor takes a file path (+ optional (start, stop) unit range) and yields
+# units: {"text": str, "kind": "page" | "slide" | "section", "index": int (1-based)}.
+# Units keep their position so chunks can point back to a page / slide / section.
+
+Extractor = Callable[..., Iterator[dict]]
+
+EXTRACTORS: Dict[str, Extractor] = {}    # ".pdf" -> extractor
+MIME_TYPES: Dict[str, str] = {}          # "application/pdf" -> ".pdf"
+_UNIT_COUNTERS: Dict[str, Callable[[str], int]] = {}
+
+
+def register_extractor(extensions: Iterable[str], mime_types: Iterable[str] = (), count_units=None):
     """
-    uploaded_file is Streamlit's UploadedFile.
-    Supports .pdf and .docx.
+    Registers an extractor for file extensions / MIME types.
+    count_units(path) -> int marks the format as splittable into unit ranges across workers.
     """
-    if uploaded_file is None:
-        return ""
+    def deco(fn: Extractor) -> Extractor:
+        for ext in extensions:
+            EXTRACTORS[ext] = fn
+            if count_units is not None:
+                _UNIT_COUNTERS[ext] = count_units
+        for mime in mime_types:
+            MIME_TYPES[mime] = next(iter(extensions))
+        return fn
+    return deco
 
-    name = (uploaded_file.name or "").lower()
 
-    # Streamlit UploadedFile provides .getvalue() -> bytes
-    file_bytes = uploaded_file.getvalue()
+def supported_extensions() -> List[str]:
+    """
+    Extensions without the dot, e.g. for st.file_uploader(type=...).
+    """
+    return sorted(ext.lstrip(".") for ext in EXTRACTORS)
 
-    if name.endswith(".pdf"):
-        return _extract_pdf_bytes(file_bytes)
-    if name.endswith(".docx"):
-        return _extract_docx_bytes(file_bytes)
 
-    return ""
+def _resolve_ext(name: Optional[str], mime: Optional[str] = None) -> Optional[str]:
+    ext = os.path.splitext((name or "").lower())[1]
+    if ext in EXTRACTORS:
+        return ext
+    return MIME_TYPES.get((mime or "").split(";")[0].strip().lower())
 
 
-def _extract_pdf_bytes(file_bytes: bytes) -> str:
-    reader = PdfReader(BytesIO(file_bytes))
-    parts = []
-    for page in reader.pages:
-        txt = page.extract_text() or ""
-        if txt.strip():
-            parts.append(txt)
-    return "\n".join(parts).strip()
+# ---------- PDF ----------
+
+def _count_pdf_pages(path: str) -> int:
+    if os.path.getsize(path) == 0:
+        return 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return len(PdfReader(mm).pages)
+
 
+@register_extractor([".pdf"], ["application/pdf"], count_units=_count_pdf_pages)
+def _iter_pdf_pages(path: str, unit_range: Optional[Tuple[int, int]] = None) -> Iterator[dict]:
+    if os.path.getsize(path) == 0:
+        return
+    # pypdf copies a path into a BytesIO; an mmap lets it read straight from the page cache
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        reader = PdfReader(mm)
+        start, stop = unit_range or (0, len(reader.pages))
+        for i in range(start, stop):
+            txt = reader.pages[i].extract_text() or ""
+            if txt.strip():
+                yield {"text": txt, "kind": "page", "index": i + 1}
 
-def _extract_docx_bytes(file_bytes: bytes) -> str:
-    doc = Document(BytesIO(file_bytes))
-    parts = []
+
+# ---------- DOCX ----------
+
+@register_extractor(
+    [".docx"],
+    ["application/vnd.openxmlformats-officedocument.wordprocessingml.document"],
+)
+def _iter_docx_sections(path: str, unit_range=None) -> Iterator[dict]:
+    # python-docx (zipfile) reads members from the file on demand.
+    # A new section starts at every Heading-styled paragraph.
+    doc = Document(path)
+    index, lines = 1, []
     for p in doc.paragraphs:
         t = (p.text or "").strip()
-        if t:
-            parts.append(t)
-    return "\n".join(parts).strip()
+        if not t:
+            continue
+        style = (getattr(p.style, "name", "") or "").lower()
+        if style.startswith("heading") and lines:
+            yield {"text": "\n".join(lines), "kind": "section", "index": index}
+            index, lines = index + 1, []
+        lines.append(t)
+    if lines:
+        yield {"text": "\n".join(lines), "kind": "section", "index": index}
+
+
+# ---------- PPTX ----------
+
+@register_extractor(
+    [".pptx"],
+    ["application/vnd.openxmlformats-officedocument.presentationml.presentation"],
+)
+def _iter_pptx_slides(path: str, unit_range=None) -> Iterator[dict]:
+    try:
+        from pptx import Presentation
+    except ImportError as e:
+        raise RuntimeError("PPTX support needs python-pptx: pip install python-pptx") from e
+
+    prs = Presentation(path)
+    for i, slide in enumerate(prs.slides, start=1):
+        parts = []
+        for shape in slide.shapes:
+            if getattr(shape, "has_text_frame", False) and shape.has_text_frame:
+                parts.append(shape.text_frame.text)
+            elif getattr(shape, "has_table", False) and shape.has_table:
+                for row in shape.table.rows:
+                    parts.append(" | ".join(cell.text for cell in row.cells))
+        if slide.has_notes_slide:
+            parts.append(slide.notes_slide.notes_text_frame.text)
+        txt = "\n".join(p for p in parts if p and p.strip())
+        if txt.strip():
+            yield {"text": txt, "kind": "slide", "index": i}
+
+
+# ---------- Markdown / plain text ----------
+
+_MD_HEADING_RE = re.compile(r"^#{1,3}\s")
+_MD_BLOCK_RE = re.compile(r"^\s*(#{1,6}\s+|[-*+]\s+|>\s?|\d+[.)]\s+)")
+# `code` spans (kept verbatim) or paired *emphasis* / __strong__ not inside a word;
+# lone markers like snake_case, 2*3 or a * b are left alone
+_MD_INLINE_RE = re.compile(r"(`+)(.+?)\1|(?<![\w*_])(\*\*|__|\*|_)(?=\S)(.+?)(?<=\S)\3(?![\w*_])")
+
+
+def _strip_markdown(line: str) -> str:
+    line = _MD_BLOCK_RE.sub("", line)
+    return _MD_INLINE_RE.sub(lambda m: m.group(2) if m.group(1) else m.group(4), line)
+
+
+@register_extractor([".md", ".markdown"], ["text/markdown", "text/x-markdown"])
+def _iter_markdown_sections(path: str, unit_range=None) -> Iterator[dict]:
+    index, lines, in_code = 1, [], False
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        for raw in f:
+            if raw.lstrip().startswith("```"):
+                in_code = not in_code
+                continue
+            if not in_code and _MD_HEADING_RE.match(raw) and lines:
+                yield {"text": "\n".join(lines), "kind": "section", "index": index}
+                index, lines = index + 1, []
+            lines.append(raw.rstrip("\n") if in_code else _strip_markdown(raw.rstrip("\n")))
+    if lines:
+        yield {"text": "\n".join(lines), "kind": "section", "index": index}
+
+
+@register_extractor([".txt"], ["text/plain"])
+def _iter_text_blocks(path: str, unit_range=None) -> Iterator[dict]:
+    index, lines = 1, []
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        for raw in f:
+            lines.append(raw)
+            if len(lines) >= TEXT_LINES_PER_UNIT:
+                yield {"text": "".join(lines), "kind": "section", "index": index}
+                index, lines = index + 1, []
+    if lines:
+        yield {"text": "".join(lines), "kind": "section", "index": index}
+
+
+# ---------- HTML ----------
+
+class _HTMLSections(HTMLParser):
+    """Collects visible text, starting a new section at h1-h3."""
+
+    BLOCK = {"p", "div", "li", "br", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "pre"}
+    SKIP = {"script", "style", "noscript", "template", "head"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sections: List[str] = []
+        self._buf: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in ("h1", "h2", "h3") and "".join(self._buf).strip():
+            self.sections.append("".join(self._buf))
+            self._buf = []
+        if tag in self.BLOCK:
+            self._buf.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skip:
+            self._skip -= 1
+        elif tag in self.BLOCK:
+            self._buf.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._buf.append(data)
+
+    def close(self):
+        super().close()
+        if "".join(self._buf).strip():
+            self.sections.append("".join(self._buf))
+        self._buf = []
+
+
+def _iter_html_sections(path: str) -> Iterator[str]:
+    parser = _HTMLSections()
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        for block in iter(lambda: f.read(SPOOL_CHUNK_SIZE), ""):
+            parser.feed(block)
+            # hand finished sections out as they complete
+            while len(parser.sections) > 1:
+                yield parser.sections.pop(0)
+    parser.close()
+    yield from parser.sections
+
+
+@register_extractor([".html", ".htm"], ["text/html", "application/xhtml+xml"])
+def _iter_html_units(path: str, unit_range=None) -> Iterator[dict]:
+    for i, txt in enumerate(_iter_html_sections(path), start=1):
+        if txt.strip():
+            yield {"text": txt, "kind": "section", "index": i}
+
+
+# ---------- upload handling ----------
+
+@contextmanager
+def spooled_upload(uploaded_file) -> Iterator[str]:
+    """
+    Writes the upload to a temp file and yields its path; the file is removed afterwards.
+    Streamlit's UploadedFile is a BytesIO, so getbuffer() writes it without a copy.
+    """
+    suffix = os.path.splitext((uploaded_file.name or "").lower())[1]
+    fd, path = tempfile.mkstemp(prefix="study_upload_", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if hasattr(uploaded_file, "getbuffer"):
+                out.write(uploaded_file.getbuffer())
+            else:
+                uploaded_file.seek(0)
+                shutil.copyfileobj(uploaded_file, out, SPOOL_CHUNK_SIZE)
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _run_job(job: tuple) -> List[dict]:
+    """
+    Worker entry point (must be top-level to be picklable): extract one file or unit range.
+    """
+    path, ext, unit_range = job
+    return list(EXTRACTORS[ext](path, unit_range))
+
+
+def _as_list(uploaded_files) -> list:
+    if uploaded_files is None:
+        return []
+    if isinstance(uploaded_files, (list, tuple)):
+        return [f for f in uploaded_files if f is not None]
+    return [uploaded_files]
+
+
+def extract_units(uploaded_files, max_workers: int = EXTRACT_WORKERS) -> Iterator[dict]:
+    """
+    Yields units from one or many uploads, in upload order, each tagged with "source" (file name).
+    Files (and page ranges of large PDFs) are extracted in a process pool when
+    there is more than one job; unsupported files are skipped.
+    max_workers=1 keeps everything in-process and streams unit by unit (lowest peak).
+    """
+    files = _as_list(uploaded_files)
+    with ExitStack() as stack:
+        jobs = []
+        for f in files:
+            ext = _resolve_ext(f.name, getattr(f, "type", None))
+            if ext is None:
+                print(f"Extract: skipping unsupported file {f.name!r}", flush=True)
+                continue
+            path = stack.enter_context(spooled_upload(f))
+            counter = _UNIT_COUNTERS.get(ext)
+            # counting parses the whole file; not worth it for one small upload
+            worth_splitting = len(files) > 1 or os.path.getsize(path) >= SPLIT_MIN_BYTES
+            n_units = counter(path) if counter is not None and max_workers > 1 and worth_splitting else 0
+            if n_units > PDF_PAGES_PER_JOB:
+                for start in range(0, n_units, PDF_PAGES_PER_JOB):
+                    jobs.append((f.name, (path, ext, (start, min(n_units, start + PDF_PAGES_PER_JOB)))))
+            else:
+                jobs.append((f.name, (path, ext, None)))
+
+        if len(jobs) <= 1 or max_workers <= 1:
+            for name, (path, ext, unit_range) in jobs:
+                for unit in EXTRACTORS[ext](path, unit_range):
+                    yield {**unit, "source": name}
+            return
+
+        workers = min(max_workers, len(jobs))
+        # spawn, not fork: the app process is multithreaded and has torch loaded,
+        # and forking that can deadlock the children on locks held by other threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # At most `workers` jobs in flight, consumed in job order: the parent holds
+            # a few jobs' units (<= PDF_PAGES_PER_JOB pages each), never the whole document.
+            inflight: deque = deque()
+            pending = iter(jobs)
+            for name, job in islice(pending, workers):
+                inflight.append((name, pool.submit(_run_job, job)))
+            while inflight:
+                name, fut = inflight.popleft()
+                units = fut.result()
+                nxt = next(pending, None)
+                if nxt is not None:
+                    inflight.append((nxt[0], pool.submit(_run_job, nxt[1])))
+                units.reverse()
+                while units:  # release each unit's text once it is handed on
+                    yield {**units.pop(), "source": name}
+
+
+def extract_notes(uploaded_files, max_workers: int = EXTRACT_WORKERS) -> Tuple[str, List[dict]]:
+    """
+    Cleaned notes text for one or many uploads, plus unit spans:
+    [{"offset": char offset in the text, "source", "kind", "index"}], in order.
+    """
+    lines: List[str] = []
+    spans: List[dict] = []
+    offset = 0
+    for unit in extract_units(uploaded_files, max_workers=max_workers):
+        first = True
+        for ln in iter_clean_lines([unit["text"]]):
+            if first:
+                spans.append({"offset": offset, "source": unit["source"], "kind": unit["kind"], "index": unit["index"]})
+                first = False
+            lines.append(ln)
+            offset += len(ln) + 1
+    return "\n".join(lines), spans
+
+
+def extract_text_from_uploaded_file(uploaded_file) -> str:
+    """
+    uploaded_file is Streamlit's UploadedFile (or a list of them).
+    Supports every registered format (see supported_extensions()).
+    """
+    return "\n".join(u["text"] for u in extract_units(uploaded_file)).strip()
+
+
+def extract_clean_text_from_uploaded_file(uploaded_file) -> str:
+    """
+    Same result as clean_text(extract_text_from_uploaded_file(f)), with a lower peak:
+    the upload is spooled to disk and memory-mapped, and units are cleaned one
+    at a time, so only the final text is held in full.
+    """
+    return extract_notes(uploaded_file)[0]
+
+
+def iter_clean_lines(parts: Iterable[str]) -> Iterator[str]:
+    """
+    Streaming clean_text: yields stripped, non-empty lines part by part (page, paragraph...).
+    """
+    for part in parts:
+        for ln in part.replace("\r", "\n").split("\n"):
+            ln = ln.strip()
+            if ln:
+                yield ln
 
 
 def clean_text(text: Optional[str]) -> str:
-    t = (text or "").replace("\r", "\n")
-    # normalize whitespace a bit
-    lines = [ln.strip() for ln in t.split("\n")]
-    lines = [ln for ln in lines if ln]  # drop empty
-    return "\n".join(lines).strip()
+    # normalize whitespace a bit: strip lines, drop empty ones
+    return "\n".join(iter_clean_lines([text or ""]))
@@ -12,10 +12,15 @@ STRICT RULES (must follow):
 - No markdown. No extra commentary.
 """
 
-QA_PROMPT = """Context:
+# Prompts are laid out as CONTEXT_BLOCK + <mode task>, so the system prompt and
+# context form a byte-identical prefix across modes and follow-up questions.
+# That lets Ollama reuse its KV cache for the prefix (see llm_runner.StudySession).
+CONTEXT_BLOCK = """Context:
 {context}
 
-Question:
+"""
+
+QA_TASK = """Question:
 {question}
 
 Return JSON in this exact schema:
@@ -41,10 +46,7 @@ Otherwise:
   - "missing": null
 """
 
-NOTES_PROMPT = """Context:
-{context}
-
-Topic / Question:
+NOTES_TASK = """Topic / Question:
 {question}
 
 Create exam-focused revision notes using ONLY the context.
@@ -76,10 +78,7 @@ Otherwise:
 - Keep revision_notes short, bullet-like, exam-oriented.
 """
 
-MCQ_PROMPT = """Context:
-{context}
-
-Topic / Question:
+MCQ_TASK = """Topic / Question:
 {question}
 
 Generate 5 MCQs using ONLY the context.
@@ -112,3 +111,125 @@ Otherwise:
   - "missing": null
 - Explanations must be directly supported by context.
 """
+
+# Chat follow-ups: compact conversation history sits between the context and the task
+CHAT_HISTORY_BLOCK = """Conversation so far (use only to resolve what the question refers to; it is NOT a source of facts):
+{history}
+
+"""
+
+QA_PROMPT = CONTEXT_BLOCK + QA_TASK
+NOTES_PROMPT = CONTEXT_BLOCK + NOTES_TASK
+MCQ_PROMPT = CONTEXT_BLOCK + MCQ_TASK
+
+TASK_PROMPTS = {
+    "qa": QA_TASK,
+    "notes": NOTES_TASK,
+    "mcq": MCQ_TASK,
+}
+
+CHAT_QA_PROMPT = CONTEXT_BLOCK + CHAT_HISTORY_BLOCK + QA_TASK
+
+REWRITE_PROMPT = """Conversation so far:
+{history}
+
+Follow-up question:
+{question}
+
+Rewrite the follow-up as ONE standalone search query that makes sense without the conversation.
+Output only the query text. No quotes. No explanation.
+"""
+
+# Used by the MCQ fan-out path: one small request per question, run in parallel.
+MCQ_ITEM_PROMPT = """Context:
+{context}
+
+Topic / Question:
+{question}
+
+Generate exactly 1 MCQ using ONLY the context.
+This is question {index} of {total}: base it on the {ordinal} most important distinct fact in the context.
+
+Return JSON in this exact schema:
+{{
+  "q": "string",
+  "options": ["A) ...", "B) ...", "C) ...", "D) ..."],
+  "answer": "A|B|C|D",
+  "explanation": "string",
+  "evidence": ["string"]
+}}
+
+Rules:
+- Use ONLY the context above.
+- "evidence" MUST include 1 short direct quote copied verbatim from the context that supports the correct answer/explanation.
+- If you cannot support an MCQ with a quote from the context, return exactly: {{"q": null}}
+- Explanations must be directly supported by context.
+"""
+
+# JSON schemas mirroring the prompts above.
+# Passed to Ollama's `format` option so decoding is constrained to valid output.
+_STR = {"type": "string"}
+_STR_LIST = {"type": "array", "items": _STR}
+_MISSING = {"type": ["string", "null"]}
+
+QA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "mode": {"type": "string", "enum": ["qa"]},
+        "answer": _STR,
+        "key_points": _STR_LIST,
+        "evidence": _STR_LIST,
+        "missing": _MISSING,
+    },
+    "required": ["mode", "answer", "key_points", "evidence", "missing"],
+}
+
+NOTES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "mode": {"type": "string", "enum": ["notes"]},
+        "topic": _STR,
+        "revision_notes": _STR_LIST,
+        "definitions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"term": _STR, "definition": _STR},
+                "required": ["term", "definition"],
+            },
+        },
+        "common_mistakes": _STR_LIST,
+        "evidence": _STR_LIST,
+        "missing": _MISSING,
+    },
+    "required": ["mode", "topic", "revision_notes", "definitions", "common_mistakes", "evidence", "missing"],
+}
+
+MCQ_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "q": {"type": ["string", "null"]},
+        "options": {"type": "array", "items": _STR, "minItems": 4, "maxItems": 4},
+        "answer": {"type": "string", "enum": ["A", "B", "C", "D"]},
+        "explanation": _STR,
+        "evidence": _STR_LIST,
+    },
+    "required": ["q", "options", "answer", "explanation", "evidence"],
+}
+
+MCQ_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "mode": {"type": "string", "enum": ["mcq"]},
+        "topic": _STR,
+        "mcqs": {"type": "array", "items": MCQ_ITEM_SCHEMA},
+        "missing": _MISSING,
+    },
+    "required": ["mode", "topic", "mcqs", "missing"],
+}
+
+SCHEMAS = {
+    "qa": QA_SCHEMA,
+    "notes": NOTES_SCHEMA,
+    "mcq": MCQ_SCHEMA,
+}
@@ -1,45 +1,350 @@
 from __future__ import annotations
-from typing import Callable, Dict
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 
-from ollama_client import ollama_chat, extract_json_first
+from ollama_client import ollama_chat, ollama_chat_api, extract_json_first
+from router import AUTO_MODEL, ROUTE_TIERS, TIER_NUM_CTX, routed_chat_fn, run_routed
 from llm_prompts import (
     SYSTEM_PROMPT,
+    CONTEXT_BLOCK,
     QA_PROMPT,
     NOTES_PROMPT,
     MCQ_PROMPT,
+    MCQ_ITEM_PROMPT,
+    CHAT_QA_PROMPT,
+    MCQ_ITEM_SCHEMA,
+    SCHEMAS,
 )
 
+# Separator used by rag.retrieve_sources when joining chunks into one context
+CHUNK_SEPARATOR = "\n\n---\n\n"
+
+MCQ_COUNT = 5
+MCQ_FANOUT_WORKERS = 4
+MCQ_FANOUT_RETRIES = 2
+
+MAX_CONTEXT_CHARS = 8000
+SESSION_KEEP_ALIVE = "30m"
+
+_ORDINALS = ["1st", "2nd", "3rd", "4th", "5th", "6th", "7th", "8th", "9th", "10th"]
+
+
 def run_study_llm(
     model: str,
     mode: str,
     context: str,
     question: str,
+    mcq_fanout: bool = False,
+    constrained: bool = True,
+    session: Optional["StudySession"] = None,
+    history: str = "",
 ) -> Dict:
     """
     Runs a single LLM call for Study Assistant.
+    With mcq_fanout=True, mcq mode is split into parallel per-question calls.
+    With constrained=True, decoding is constrained to the mode's JSON schema.
+    With a session, the call reuses the session's warm model and prompt prefix.
+    history (qa mode only) is a compact conversation transcript for follow-ups.
     """
     temperature = 0.0  # deterministic, exam-safe
-    context = context[:8000]  # keep prompt lighter (adjust later)
+    context = context[:MAX_CONTEXT_CHARS]  # keep prompt lighter (adjust later)
+
+    routed = model == AUTO_MODEL and session is None
+    if session is not None and model == AUTO_MODEL:
+        model = session.model
+
+    if mode == "mcq" and mcq_fanout:
+        chat_fn = routed_chat_fn("mcq_item") if routed else None
+        return run_mcq_fanout(model=model, context=context, question=question, constrained=constrained, chat_fn=chat_fn)
 
     if mode == "notes":
         user_prompt = NOTES_PROMPT.format(context=context, question=question)
     elif mode == "mcq":
         user_prompt = MCQ_PROMPT.format(context=context, question=question)
+    elif history:
+        user_prompt = CHAT_QA_PROMPT.format(context=context, history=history, question=question)
     else:
         user_prompt = QA_PROMPT.format(context=context, question=question)
 
     print("Ollama: starting generation...", flush=True)
 
-    raw = ollama_chat(
-        model,
-        prompt=user_prompt,
-        system=SYSTEM_PROMPT,
-        temperature=temperature,
-        timeout_s=120,
-    )
+    fmt = SCHEMAS.get(mode, SCHEMAS["qa"]) if constrained else None
+    if routed:
+        result = run_routed(
+            mode,
+            user_prompt,
+            system=SYSTEM_PROMPT,
+            parse=lambda raw: _clean_result(mode, validate_result(mode, extract_json_first(raw))),
+            on_invalid=lambda e: _insufficient_result(mode, question, reason=str(e)),
+            format=fmt,
+            temperature=temperature,
+        )
+        print("Ollama: generation finished.", flush=True)
+        return result
+
+    if session is not None:
+        raw = session.chat(user_prompt, format=fmt, temperature=temperature, timeout_s=120)
+    else:
+        raw = ollama_chat(
+            model,
+            prompt=user_prompt,
+            system=SYSTEM_PROMPT,
+            temperature=temperature,
+            timeout_s=120,
+            format=fmt,
+        )
     print("Ollama: generation finished.", flush=True)
 
-    return extract_json_first(raw)
+    try:
+        # a repaired truncation can parse to a near-empty object; never return that as a result
+        return _clean_result(mode, validate_result(mode, extract_json_first(raw)))
+    except ValueError as e:
+        print(f"Ollama: invalid {mode} output: {e}", flush=True)
+        return _insufficient_result(mode, question, reason=str(e))
+
+
+def run_mcq_fanout(
+    model: str,
+    context: str,
+    question: str,
+    n: int = MCQ_COUNT,
+    max_workers: int = MCQ_FANOUT_WORKERS,
+    retries: int = MCQ_FANOUT_RETRIES,
+    constrained: bool = True,
+    chat_fn: Optional[Callable[..., str]] = None,
+) -> Dict:
+    """
+    Generates n MCQs as n small concurrent Ollama requests instead of one big one.
+    Each item is validated on its own; only failed or duplicate items are retried.
+    Returns the same {"mode": "mcq", "mcqs": [...]} schema as MCQ_PROMPT.
+    """
+    chat_fn = chat_fn or ollama_chat
+    chunks = [c for c in context.split(CHUNK_SEPARATOR) if c.strip()] or [context]
+
+    def generate(i: int, attempt: int) -> Optional[Dict]:
+        # Each item gets its own share of the chunks so prompts stay small and questions
+        # spread out; with more chunks than items, every retrieved chunk still reaches one
+        if len(chunks) > n:
+            primary, repeat = CHUNK_SEPARATOR.join(chunks[i::n]), 0
+        else:
+            primary, repeat = chunks[i % len(chunks)], i // len(chunks)
+        user_prompt = MCQ_ITEM_PROMPT.format(
+            context=primary,
+            question=question,
+            index=i + 1,
+            total=n,
+            ordinal=_ORDINALS[min(repeat, len(_ORDINALS) - 1)],
+        )
+        try:
+            raw = chat_fn(
+                model,
+                prompt=user_prompt,
+                system=SYSTEM_PROMPT,
+                # nudge retries away from the output that just failed
+                temperature=0.0 if attempt == 0 else 0.3,
+                timeout_s=120,
+                format=MCQ_ITEM_SCHEMA if constrained else None,
+            )
+            return validate_mcq(extract_json_first(raw))
+        except Exception as e:
+            print(f"Ollama: MCQ item {i + 1} attempt {attempt + 1} failed: {e}", flush=True)
+            return None
+
+    print(f"Ollama: starting MCQ fan-out ({n} items, {max_workers} workers)...", flush=True)
+
+    results: List[Optional[Dict]] = [None] * n
+    pending = list(range(n))
+    retried = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, n))) as pool:
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            if attempt > 0:
+                retried += len(pending)
+            futures = {i: pool.submit(generate, i, attempt) for i in pending}
+            for i, fut in futures.items():
+                results[i] = fut.result()
+
+            # drop duplicates so the retry can produce a different question
+            seen = set()
+            for i, item in enumerate(results):
+                if item is None:
+                    continue
+                key = item["q"].strip().lower()
+                if key in seen:
+                    results[i] = None
+                else:
+                    seen.add(key)
+
+            pending = [i for i in range(n) if results[i] is None]
+
+    print("Ollama: MCQ fan-out finished.", flush=True)
+
+    mcqs = [item for item in results if item is not None]
+    return {
+        "mode": "mcq",
+        "topic": question,
+        "mcqs": mcqs,
+        "missing": None if mcqs else "Insufficient context.",
+        "fanout": {"requested": n, "generated": len(mcqs), "retried": retried},
+    }
+
+
+def _insufficient_result(mode: str, question: str, reason: str) -> Dict:
+    """
+    Well-formed result for the mode when the model output was unusable.
+    """
+    base = {"mode": mode if mode in SCHEMAS else "qa", "missing": "Insufficient context.", "invalid_output": reason}
+    if mode == "notes":
+        return {**base, "topic": question, "revision_notes": [], "definitions": [], "common_mistakes": [], "evidence": []}
+    if mode == "mcq":
+        return {**base, "topic": question, "mcqs": []}
+    return {**base, "answer": "Insufficient context.", "key_points": [], "evidence": []}
+
+
+def _clean_result(mode: str, data: Dict) -> Dict:
+    """
+    Drops MCQ items that came back malformed (e.g. from repaired, truncated output)
+    so one bad item does not invalidate the batch.
+    """
+    if mode == "mcq" and isinstance(data, dict) and isinstance(data.get("mcqs"), list):
+        data["mcqs"] = [m for m in (validate_mcq(item) for item in data["mcqs"]) if m is not None]
+        if not data["mcqs"] and not data.get("missing"):
+            data["missing"] = "Insufficient context."
+    return data
+
+
+def validate_result(mode: str, data) -> Dict:
+    """
+    Raises ValueError when parsed output misses the mode's required keys or
+    every MCQ in it is malformed; returns data unchanged otherwise.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+    missing = [k for k in SCHEMAS.get(mode, SCHEMAS["qa"])["required"] if k not in data]
+    if missing:
+        raise ValueError(f"{mode} output is missing {', '.join(missing)}")
+    if mode == "mcq":
+        if not isinstance(data["mcqs"], list):
+            raise ValueError("mcqs is not a list")
+        if data["mcqs"] and not any(validate_mcq(item) for item in data["mcqs"]):
+            raise ValueError("all MCQs were malformed")
+    return data
+
+
+def validate_mcq(item) -> Optional[Dict]:
+    """
+    Validates and normalizes one MCQ item.
+    Returns None when the item is unusable (or the model reported insufficient context).
+    """
+    if not isinstance(item, dict):
+        return None
+
+    q = item.get("q")
+    options = item.get("options")
+    if not isinstance(q, str) or not q.strip():
+        return None
+    if not isinstance(options, list) or len(options) != 4 or not all(isinstance(o, str) for o in options):
+        return None
+
+    answer = str(item.get("answer") or "").strip().upper()[:1]
+    if answer not in ("A", "B", "C", "D"):
+        return None
+
+    evidence = item.get("evidence") or []
+    if isinstance(evidence, str):
+        evidence = [evidence]
+    evidence = [e for e in evidence if isinstance(e, str) and e.strip()]
+
+    return {
+        "q": q.strip(),
+        "options": options,
+        "answer": answer,
+        "explanation": str(item.get("explanation") or ""),
+        "evidence": evidence,
+    }
+
+
+class StudySession:
+    """
+    Keeps one model warm on the Ollama server and a byte-identical
+    SYSTEM_PROMPT + context prefix across follow-up questions and modes,
+    so the server can reuse its KV cache and prefill is paid once.
+
+    Retrieved chunks are pinned in first-seen order: a follow-up that retrieves
+    chunks already in the session keeps the prefix unchanged, and new chunks are
+    appended after it while they fit the budget. The pinned context only resets
+    when a question's top chunk no longer fits.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        keep_alive: str = SESSION_KEEP_ALIVE,
+        max_context_chars: int = MAX_CONTEXT_CHARS,
+    ):
+        self.model = model
+        self.keep_alive = keep_alive
+        self.max_context_chars = max_context_chars
+        self.chunks: List[str] = []
+        self.stats: deque = deque(maxlen=200)  # per-call Ollama timings
+        self._lock = threading.Lock()  # build_context runs from prefetch threads too
+
+    def build_context(self, chunks: List[str]) -> str:
+        with self._lock:
+            new = [c for c in dict.fromkeys(chunks) if c not in self.chunks]
+            if new and not self._pin(new) and chunks[0] not in self.chunks:
+                # the best chunk cannot join the prefix within budget: start a fresh one
+                self.chunks = []
+                self._pin(list(dict.fromkeys(chunks)))
+            return CHUNK_SEPARATOR.join(self.chunks)[:self.max_context_chars]
+
+    def _pin(self, new: List[str]) -> bool:
+        """
+        Appends new chunks (in order) while the pinned context stays within budget,
+        so the prefix never has to be truncated. Returns True if all of them fit.
+        """
+        used = len(CHUNK_SEPARATOR.join(self.chunks))
+        for c in new:
+            size = len(c) + (len(CHUNK_SEPARATOR) if self.chunks else 0)
+            if self.chunks and used + size > self.max_context_chars:
+                return False
+            self.chunks.append(c)
+            used += size
+        return True
 
+    def warm(self, context: str, timeout_s: int = 120) -> Dict:
+        """
+        Prefills SYSTEM_PROMPT + context so the next question only pays for its own tokens.
+        """
+        return self._call(CONTEXT_BLOCK.format(context=context), options={"num_predict": 1}, timeout_s=timeout_s)
 
+    def chat(
+        self,
+        prompt: str,
+        format=None,
+        temperature: float = 0.0,
+        timeout_s: int = 120,
+    ) -> str:
+        return self._call(prompt, format=format, options={"temperature": temperature}, timeout_s=timeout_s)["content"]
 
+    def _call(self, prompt: str, format=None, options: Optional[Dict] = None, timeout_s: int = 120) -> Dict:
+        if self.model == ROUTE_TIERS["large"]:
+            # same num_ctx as routed calls: a different value would reload the model and drop its cache
+            options = {"num_ctx": TIER_NUM_CTX["large"], **(options or {})}
+        resp = ollama_chat_api(
+            self.model,
+            [
+                {"role": "system", "content": SYSTEM_PROMPT.strip()},
+                {"role": "user", "content": prompt.strip()},
+            ],
+            format=format,
+            options=options,
+            keep_alive=self.keep_alive,
+            timeout_s=timeout_s,
+        )
+        self.stats.append({k: v for k, v in resp.items() if k != "content"})
+        return resp
@@ -0,0 +1,458 @@
+# maintenance.py
+"""
+Chroma store maintenance: access tracking, garbage collection, compaction, size report.
+
+index_notes() stores chunks per notes_hash; edited notes get a new hash and the
+old chunks would otherwise stay in chroma_db/ forever.
+
+Usage:
+  python maintenance.py report
+  python maintenance.py gc --max-age-days 30 --max-mb 500 --compact
+  python maintenance.py compact
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import artifacts
+import rag
+
+ACCESS_FILE_NAME = "notes_access.json"
+ACCESS_FLUSH_INTERVAL_S = 60      # retrieval touches are batched to disk
+GC_MAX_AGE_DAYS = 30
+GC_MAX_MB: Optional[float] = None  # no storage budget by default
+GC_MIN_IDLE_S = 3600              # never evict notes used within the last hour
+GC_INTERVAL_S = 6 * 3600
+COMPACT_BATCH_SIZE = 512
+RETIRED_GRACE_S = 60              # a retired collection may still serve in-flight requests this long
+SIZE_SAMPLE = 256                 # records sampled to estimate live bytes per chunk
+HNSW_LINK_BYTES = 2 * 16 * 4      # level-0 neighbour links per vector (hnswlib, M=16)
+
+_LOCK = threading.RLock()
+_ACCESS: Optional[Dict[str, Dict]] = None
+_DIRTY = False
+_LAST_FLUSH = 0.0
+_BACKGROUND: Optional[threading.Thread] = None
+
+
+# ---------- access tracking ----------
+
+def _access_path() -> str:
+    return os.path.join(rag.PERSIST_DIR, ACCESS_FILE_NAME)
+
+
+def load_access() -> Dict[str, Dict]:
+    """
+    {notes_hash: {"last_access": ts, "indexed_at": ts, "chunks": n}}
+    """
+    global _ACCESS
+    with _LOCK:
+        if _ACCESS is None:
+            try:
+                with open(_access_path(), encoding="utf-8") as f:
+                    _ACCESS = json.load(f)
+            except (OSError, ValueError):
+                _ACCESS = {}
+        return _ACCESS
+
+
+def _flush(force: bool = False) -> None:
+    global _DIRTY, _LAST_FLUSH
+    with _LOCK:
+        if not _DIRTY or (not force and time.time() - _LAST_FLUSH < ACCESS_FLUSH_INTERVAL_S):
+            return
+        os.makedirs(rag.PERSIST_DIR, exist_ok=True)
+        tmp = _access_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(load_access(), f, indent=1)
+        os.replace(tmp, _access_path())
+        _DIRTY = False
+        _LAST_FLUSH = time.time()
+
+
+def touch(notes_hash: str, chunks: Optional[int] = None) -> None:
+    """
+    Records an access. Called by rag on index (chunks given) and on retrieval.
+    """
+    global _DIRTY
+    now = time.time()
+    with _LOCK:
+        entry = load_access().setdefault(notes_hash, {"indexed_at": now, "chunks": None})
+        entry["last_access"] = now
+        if chunks is not None:
+            entry["indexed_at"] = now
+            entry["chunks"] = chunks
+        _DIRTY = True
+        _flush(force=chunks is not None)
+
+
+# ---------- report ----------
+
+def _iter_metadatas(col, page_size: int = 5000) -> Iterable[dict]:
+    offset = 0
+    while True:
+        res = col.get(include=["metadatas"], limit=page_size, offset=offset)
+        metas = res.get("metadatas") or []
+        if not metas:
+            return
+        yield from metas
+        offset += len(metas)
+
+
+def chunk_counts() -> Dict[str, int]:
+    if rag.VECTOR_MODE != "chroma":
+        return rag.get_compact_store().counts()
+
+    counts: Dict[str, int] = {}
+    for meta in _iter_metadatas(rag._get_collection()):
+        h = (meta or {}).get("notes_hash") or "?"
+        counts[h] = counts.get(h, 0) + 1
+    return counts
+
+
+def disk_usage(path: Optional[str] = None) -> int:
+    total = 0
+    for root, _, files in os.walk(path or rag.PERSIST_DIR):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def live_bytes(counts: Optional[Dict[str, int]] = None) -> int:
+    """
+    Estimated size of the live store only: unlike disk_usage(), it ignores
+    retired collections, dead vectors awaiting compaction and artifacts/.
+    Chroma: sampled document + metadata + embedding bytes (stored in sqlite and
+    in the HNSW index) per chunk, times the chunk count.
+    """
+    if rag.VECTOR_MODE != "chroma":
+        return disk_usage(rag.COMPACT_DIR)
+
+    total_chunks = sum((counts if counts is not None else chunk_counts()).values())
+    if not total_chunks:
+        return 0
+    res = rag._get_collection().get(include=["documents", "embeddings", "metadatas"], limit=SIZE_SAMPLE)
+    docs = res.get("documents") or []
+    if not docs:
+        return 0
+    sample = 0
+    for doc, emb, meta in zip(docs, res.get("embeddings") or [[]] * len(docs), res.get("metadatas") or [{}] * len(docs)):
+        sample += len((doc or "").encode("utf-8")) + len(json.dumps(meta or {}))
+        sample += 2 * 4 * len(emb if emb is not None else []) + HNSW_LINK_BYTES
+    return int(sample / len(docs) * total_chunks)
+
+
+def report() -> dict:
+    """
+    Per-document chunk counts, last access, and total disk usage of the store.
+    """
+    counts = chunk_counts()
+    access = load_access()
+    now = time.time()
+
+    docs = []
+    for h, n in sorted(counts.items(), key=lambda kv: access.get(kv[0], {}).get("last_access", 0)):
+        last = access.get(h, {}).get("last_access")
+        docs.append({
+            "notes_hash": h,
+            "chunks": n,
+            "last_access": last,
+            "idle_days": round((now - last) / 86400, 2) if last else None,
+        })
+
+    return {
+        "persist_dir": rag.PERSIST_DIR,
+        "disk_bytes": disk_usage(),
+        "live_bytes": live_bytes(counts),
+        "total_chunks": sum(counts.values()),
+        "documents": docs,
+    }
+
+
+# ---------- garbage collection ----------
+
+def evict(notes_hashes: Iterable[str]) -> List[str]:
+    global _DIRTY
+    evicted = []
+    with _LOCK:
+        access = load_access()
+        for h in notes_hashes:
+            if rag.VECTOR_MODE != "chroma":
+                # per-document files: deleting them frees the space immediately
+                rag.get_compact_store().delete(h)
+            else:
+                with rag.STORE_LOCK:
+                    rag._get_collection().delete(where={"notes_hash": h})
+            access.pop(h, None)
+            artifacts.delete(h)
+            evicted.append(h)
+            if rag._INDEXED_HASH == h:
+                rag._INDEXED_HASH = None  # force re-index on next retrieval
+        _DIRTY = True
+        _flush(force=True)
+    return evicted
+
+
+def gc(
+    max_age_days: Optional[float] = GC_MAX_AGE_DAYS,
+    max_mb: Optional[float] = GC_MAX_MB,
+    min_idle_s: float = GC_MIN_IDLE_S,
+    dry_run: bool = False,
+) -> List[str]:
+    """
+    Evicts documents idle for more than max_age_days, then least-recently-used
+    documents until the live store (live_bytes) is estimated to fit in max_mb.
+    Space is only returned to disk after compact().
+    """
+    now = time.time()
+    counts = chunk_counts()
+    access = load_access()
+
+    global _DIRTY
+    with _LOCK:
+        # documents indexed before tracking existed start their clock now
+        for h in counts:
+            if h not in access:
+                access[h] = {"indexed_at": now, "last_access": now, "chunks": counts[h]}
+                _DIRTY = True
+
+    def idle(h: str) -> float:
+        return now - access[h].get("last_access", now)
+
+    candidates = [
+        h for h in counts
+        if h != "?" and h != rag._INDEXED_HASH and idle(h) >= min_idle_s
+    ]
+    victims = []
+
+    if max_age_days is not None:
+        victims += [h for h in candidates if idle(h) > max_age_days * 86400]
+
+    if max_mb is not None:
+        total_chunks = sum(counts.values()) or 1
+        bytes_per_chunk = live_bytes(counts) / total_chunks
+        remaining = sum(n for h, n in counts.items() if h not in victims)
+        for h in sorted(candidates, key=idle, reverse=True):  # LRU first
+            if remaining * bytes_per_chunk <= max_mb * 1024 * 1024:
+                break
+            if h not in victims:
+                victims.append(h)
+                remaining -= counts[h]
+
+    if dry_run or not victims:
+        return victims
+
+    print(f"Maintenance: evicting {len(victims)} document(s): {', '.join(victims)}", flush=True)
+    return evict(victims)
+
+
+# ---------- compaction ----------
+
+def drop_retired(grace_s: float = RETIRED_GRACE_S) -> List[str]:
+    """
+    Drops collections compact() retired more than grace_s ago (entries without a
+    timestamp predate it and go immediately). Runs at the start of every
+    maintenance run and grace_s after each compaction.
+    """
+    if rag.VECTOR_MODE != "chroma":
+        return []
+    now = time.time()
+    dropped = []
+    with _LOCK, rag.STORE_LOCK:
+        pointer = rag.read_collection_pointer()
+        if not pointer["retired"]:
+            return []
+        client = rag._get_client()
+        existing = {getattr(c, "name", c) for c in client.list_collections()}
+        kept = []
+        for name in pointer["retired"]:
+            if name == pointer["active"]:
+                continue
+            if now - pointer["retired_at"].get(name, 0) < grace_s:
+                kept.append(name)
+                continue
+            # only collections compact() created and recorded are ever dropped
+            if name in existing:
+                client.delete_collection(name)
+            dropped.append(name)
+        pointer["retired"] = kept
+        pointer["retired_at"] = {n: t for n, t in pointer["retired_at"].items() if n in kept}
+        rag.write_collection_pointer(pointer)
+    if dropped:
+        print(f"Maintenance: dropped retired collection(s) {', '.join(dropped)}", flush=True)
+    return dropped
+
+
+def _schedule_drop_retired(delay_s: float = RETIRED_GRACE_S) -> None:
+    def run():
+        try:
+            drop_retired(delay_s)
+        except Exception as e:
+            print(f"Maintenance: dropping retired collections failed: {e}", flush=True)
+
+    # not a daemon: a CLI compact waits out the grace period and cleans up before exiting
+    threading.Timer(delay_s + 1, run).start()
+
+
+def compact(vacuum: bool = True) -> dict:
+    """
+    Rebuilds the collection from its live records so the HNSW index no longer
+    carries deleted vectors: copy into a new physical collection, verify the
+    count, then switch rag's collection pointer to it. The previous collection
+    is only retired, and dropped RETIRED_GRACE_S later (drop_retired), once no
+    request can still hold it.
+    Writes are blocked via rag.STORE_LOCK while copying; reads continue.
+    Optionally VACUUMs Chroma's sqlite file.
+    Nothing to do in compact vector modes (documents are separate files).
+    """
+    if rag.VECTOR_MODE != "chroma":
+        return {"chunks": sum(chunk_counts().values()), "bytes_before": disk_usage(), "bytes_after": disk_usage()}
+
+    with _LOCK, rag.STORE_LOCK:
+        drop_retired()
+        before = disk_usage()
+        client = rag._get_client()
+        pointer = rag.read_collection_pointer()
+        existing = {getattr(c, "name", c) for c in client.list_collections()}
+
+        # a leftover "pending" copy is from a failed run: nothing reads it
+        if pointer["pending"] and pointer["pending"] != pointer["active"] and pointer["pending"] in existing:
+            client.delete_collection(pointer["pending"])
+            existing.discard(pointer["pending"])
+        pointer["pending"] = None
+
+        src = client.get_or_create_collection(name=pointer["active"])
+        dst_name = f"{rag.COLLECTION_NAME}__{time.strftime('%Y%m%d%H%M%S')}"
+        if dst_name in existing:
+            raise RuntimeError(f"Collection {dst_name} already exists; not compacting over it")
+        pointer["pending"] = dst_name
+        rag.write_collection_pointer(pointer)
+        dst = client.create_collection(name=dst_name, metadata=src.metadata)
+
+        copied = 0
+        offset = 0
+        while True:
+            res = src.get(
+                include=["documents", "embeddings", "metadatas"],
+                limit=COMPACT_BATCH_SIZE,
+                offset=offset,
+            )
+            ids = res.get("ids") or []
+            if not ids:
+                break
+            dst.add(
+                ids=ids,
+                documents=res["documents"],
+                embeddings=res["embeddings"],
+                metadatas=res["metadatas"],
+            )
+            copied += len(ids)
+            offset += len(ids)
+
+        expected = src.count()
+        if dst.count() != expected or copied != expected:
+            # the pointer still names src; dst stays "pending" and is dropped next run
+            raise RuntimeError(f"Compaction copied {dst.count()} of {expected} chunks; keeping {pointer['active']}")
+
+        pointer = {
+            "active": dst_name,
+            "retired": pointer["retired"] + [pointer["active"]],
+            "retired_at": {**pointer["retired_at"], pointer["active"]: time.time()},
+            "pending": None,
+        }
+        rag.write_collection_pointer(pointer)
+
+        if vacuum:
+            db_path = os.path.join(rag.PERSIST_DIR, "chroma.sqlite3")
+            if os.path.exists(db_path):
+                try:
+                    with sqlite3.connect(db_path) as conn:
+                        conn.execute("VACUUM")
+                except sqlite3.Error as e:
+                    print(f"Maintenance: VACUUM skipped: {e}", flush=True)
+
+        after = disk_usage()
+
+    print(f"Maintenance: compacted {copied} chunks into {dst_name}, {before} -> {after} bytes "
+          f"(previous collection dropped in {RETIRED_GRACE_S}s)", flush=True)
+    _schedule_drop_retired()
+    return {"chunks": copied, "bytes_before": before, "bytes_after": after}
+
+
+# ---------- background task ----------
+
+def start_background_maintenance(
+    interval_s: float = GC_INTERVAL_S,
+    max_age_days: Optional[float] = GC_MAX_AGE_DAYS,
+    max_mb: Optional[float] = GC_MAX_MB,
+) -> threading.Thread:
+    """
+    Starts (once per process) a daemon thread that, every interval_s, drops
+    retired collections, runs gc() and compacts the store when anything was evicted.
+    """
+    global _BACKGROUND
+    with _LOCK:
+        if _BACKGROUND is not None and _BACKGROUND.is_alive():
+            return _BACKGROUND
+
+        def loop():
+            while True:
+                time.sleep(interval_s)
+                try:
+                    _flush(force=True)
+                    drop_retired()
+                    if gc(max_age_days=max_age_days, max_mb=max_mb):
+                        compact()
+                except Exception as e:
+                    print(f"Maintenance: background run failed: {e}", flush=True)
+
+        _BACKGROUND = threading.Thread(target=loop, name="chroma-maintenance", daemon=True)
+        _BACKGROUND.start()
+        return _BACKGROUND
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Chroma store maintenance for the Study Assistant.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    sub.add_parser("report", help="Per-document chunk counts and disk usage")
+
+    p_gc = sub.add_parser("gc", help="Evict old / least-recently-used documents")
+    p_gc.add_argument("--max-age-days", type=float, default=GC_MAX_AGE_DAYS)
+    p_gc.add_argument("--max-mb", type=float, default=GC_MAX_MB)
+    p_gc.add_argument("--min-idle-s", type=float, default=GC_MIN_IDLE_S)
+    p_gc.add_argument("--dry-run", action="store_true")
+    p_gc.add_argument("--compact", action="store_true", help="Compact after evicting")
+
+    sub.add_parser("compact", help="Rebuild the collection without dead vectors")
+
+    args = ap.parse_args()
+
+    if args.cmd == "report":
+        r = report()
+        print(f"{r['persist_dir']}: {r['disk_bytes'] / 1024 / 1024:.1f} MB on disk, "
+              f"~{r['live_bytes'] / 1024 / 1024:.1f} MB live, {r['total_chunks']} chunks")
+        for d in r["documents"]:
+            idle = f"{d['idle_days']:.1f}d idle" if d["idle_days"] is not None else "never accessed"
+            print(f"  {d['notes_hash']}  {d['chunks']:>6} chunks  {idle}")
+    elif args.cmd == "gc":
+        victims = gc(max_age_days=args.max_age_days, max_mb=args.max_mb,
+                     min_idle_s=args.min_idle_s, dry_run=args.dry_run)
+        print(("Would evict: " if args.dry_run else "Evicted: ") + (", ".join(victims) or "nothing"))
+        if args.compact and victims and not args.dry_run:
+            compact()
+    elif args.cmd == "compact":
+        compact()
+
+
+if __name__ == "__main__":
+    main()
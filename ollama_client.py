@@ -1,6 +1,7 @@
 from __future__ import annotations
 import subprocess
 import json
+import re
 
 def ollama_chat(
     model: str,
@@ -10,13 +11,33 @@ def ollama_chat(
     prompt: str | None = None,
     temperature: float = 0.0,
     timeout_s: int = 180,
+    format: str | dict | None = None,
+    options: dict | None = None,
+    keep_alive: str | int | None = None,
 ) -> str:
     """
     Runs a local Ollama model and returns raw text output.
     Accepts either:
       - messages=[{role, content}, ...]  (old style)
       - system=..., prompt=...           (new style)
+
+    When format (e.g. a JSON schema), options or keep_alive are given, the request
+    goes through the Ollama server API instead of `ollama run`, since the CLI
+    cannot pass them.
     """
+    if format is not None or options or keep_alive is not None:
+        if messages is None:
+            messages = _build_messages(system, prompt)
+        resp = ollama_chat_api(
+            model,
+            messages,
+            format=format,
+            options={"temperature": temperature, **(options or {})},
+            keep_alive=keep_alive,
+            timeout_s=timeout_s,
+        )
+        return resp["content"]
+
     if messages is not None:
         stitched = _stitch_messages(messages)
     else:
@@ -49,10 +70,66 @@ def ollama_chat(
     return result.stdout.decode("utf-8", errors="ignore").strip()
 
 
-def extract_json_first(s: str) -> dict:
+def ollama_chat_api(
+    model: str,
+    messages: list[dict],
+    *,
+    format: str | dict | None = None,
+    options: dict | None = None,
+    keep_alive: str | int | None = None,
+    timeout_s: int = 180,
+) -> dict:
+    """
+    Calls the Ollama server chat API (via the `ollama` package).
+    Returns {"content": str, "prompt_eval_count", "prompt_eval_duration",
+             "eval_count", "eval_duration", "total_duration"} (durations in ns).
+    """
+    try:
+        import ollama
+    except ImportError as e:
+        raise RuntimeError("The 'ollama' Python package is required: pip install ollama") from e
+
+    client = ollama.Client(timeout=timeout_s)
+
+    try:
+        resp = client.chat(
+            model=model,
+            messages=messages,
+            format=format,
+            options=options,
+            keep_alive=keep_alive,
+            stream=False,
+        )
+    except Exception as e:
+        if "timed out" in str(e).lower() or "timeout" in type(e).__name__.lower():
+            raise RuntimeError(f"Ollama timed out after {timeout_s}s. Model={model}") from e
+        raise RuntimeError(f"Ollama failed: {e}") from e
+
+    return {
+        "content": ((resp["message"] or {})["content"] or "").strip(),
+        "prompt_eval_count": resp.get("prompt_eval_count"),
+        "prompt_eval_duration": resp.get("prompt_eval_duration"),
+        "eval_count": resp.get("eval_count"),
+        "eval_duration": resp.get("eval_duration"),
+        "total_duration": resp.get("total_duration"),
+    }
+
+
+# Structural characters outside / inside a JSON string
+_STRUCT_RE = re.compile(r'[{}\[\]",]')
+_STRING_END_RE = re.compile(r'["\\]')
+
+
+def extract_json_first(s: str, repair: bool = True) -> dict:
     """
     Extract the first JSON object from a string.
     Handles cases where the model prints extra text before/after JSON.
+
+    The scan is a single string-aware pass (braces inside strings are ignored).
+    With repair=True, trailing commas are dropped and truncated output is closed
+    off after the last complete value (a cut-off scalar or string is dropped, not
+    kept half-written); the result is then marked {"repaired": True} so callers
+    can tell it is incomplete.
     """
     s = (s or "").strip()
     if not s:
@@ -69,30 +146,129 @@ def extract_json_first(s: str) -> dict:
     if start == -1:
         raise ValueError(f"No '{{' found in LLM output. Output starts with:\n{s[:300]}\n\nOutput ends with:\n{s[-300:]}")
 
-    depth = 0
-    end = None
-    for i in range(start, len(s)):
+    candidates, complete = _scan_json_object(s, start)
+
+    if not complete and not repair:
+        raise ValueError(f"Unclosed JSON object in LLM output. Output starts with:\n{s[:300]}\n\nOutput ends with:\n{s[-300:]}")
+    if not candidates:
+        raise ValueError(f"Unclosed JSON object in LLM output. Output starts with:\n{s[:300]}\n\nOutput ends with:\n{s[-300:]}")
+
+    err = None
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError as e:
+            err = err or e
+            continue
+        if not complete and isinstance(data, dict):
+            data["repaired"] = True
+        return data
+
+    candidate = candidates[0]
+    raise ValueError(
+        f"Failed to parse JSON from LLM output. "
+        f"Candidate starts with:\n{candidate[:300]}\n\nFull Output starts with:\n{s[:300]}\n\nOutput ends with:\n{s[-300:]}"
+    ) from err
+
+
+def _scan_json_object(s: str, start: int) -> tuple[list[str], bool]:
+    """
+    Single pass over s[start:], jumping between structural characters.
+    Returns (candidate texts to try in order, whether the object was closed).
+    """
+    pieces: list[str] = []
+    stack: list[str] = []
+    # last safe truncation point: (number of pieces, closers needed at that point)
+    cut: tuple[int, list[str]] | None = None
+    open_string: str | None = None
+    pos = start
+    n = len(s)
+
+    while pos < n:
+        m = _STRUCT_RE.search(s, pos)
+        if m is None:
+            pieces.append(s[pos:])
+            break
+
+        i = m.start()
         ch = s[i]
-        if ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                end = i + 1
+        if i > pos:
+            pieces.append(s[pos:i])
+
+        if ch == '"':
+            j = i + 1
+            end = None
+            while True:
+                m2 = _STRING_END_RE.search(s, j)
+                if m2 is None:
+                    break
+                if s[m2.start()] == "\\":
+                    j = m2.start() + 2
+                    continue
+                end = m2.start() + 1
                 break
+            if end is None:
+                open_string = s[i:]
+                break
+            pieces.append(s[i:end])
+            pos = end
+            continue
 
-    if end is None:
-        raise ValueError(f"Unclosed JSON object in LLM output. Output starts with:\n{s[:300]}\n\nOutput ends with:\n{s[-300:]}")
+        pos = i + 1
 
-    candidate = s[start:end].strip()
+        if ch == "{" or ch == "[":
+            stack.append("}" if ch == "{" else "]")
+            pieces.append(ch)
+            cut = (len(pieces), list(stack))
+        elif ch == "}" or ch == "]":
+            _drop_trailing_comma(pieces)
+            pieces.append(ch)
+            if stack:
+                stack.pop()
+            if not stack:
+                return ["".join(pieces)], True
+            cut = (len(pieces), list(stack))  # a just-closed container is a complete value
+        else:  # ","
+            cut = (len(pieces), list(stack))
+            pieces.append(ch)
 
-    try:
-        return json.loads(candidate)
-    except json.JSONDecodeError as e:
-        raise ValueError(
-            f"Failed to parse JSON from LLM output. "
-            f"Candidate starts with:\n{candidate[:300]}\n\nFull Output starts with:\n{s[:300]}\n\nOutput ends with:\n{s[-300:]}"
-        ) from e
+    # Truncated output: close off at the last cut point, so the value being written
+    # when the output stopped ('{"a": 12' could have been 125) is dropped; closing
+    # everything as-is is only the fallback when that does not parse
+    candidates = []
+
+    if cut is not None:
+        head = pieces[:cut[0]]
+        _drop_trailing_comma(head)
+        candidates.append("".join(head) + "".join(reversed(cut[1])))
+
+    tail = list(pieces)
+    if open_string is not None:
+        text = open_string
+        if (len(text) - len(text.rstrip("\\"))) % 2:
+            text = text[:-1]
+        tail.append(text + '"')
+    _drop_trailing_comma(tail)
+    candidates.append("".join(tail) + "".join(reversed(stack)))
+
+    return candidates, False
+
+
+def _drop_trailing_comma(pieces: list[str]) -> None:
+    i = len(pieces) - 1
+    while i >= 0 and not pieces[i].strip():
+        i -= 1
+    if i >= 0 and pieces[i] == ",":
+        pieces[i] = ""
+
+
+def _build_messages(system: str | None, prompt: str | None) -> list[dict]:
+    messages = []
+    sys_txt = (system or "").strip()
+    if sys_txt:
+        messages.append({"role": "system", "content": sys_txt})
+    messages.append({"role": "user", "content": (prompt or "").strip()})
+    return messages
 
 
 def _stitch_messages(messages: list[dict]) -> str:
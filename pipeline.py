@@ -1,12 +1,33 @@
 from __future__ import annotations
 from typing import Optional
+import uuid
 
-from extract import extract_text_from_uploaded_file, clean_text
+from extract import extract_notes, clean_text
 from llm_runner import run_study_llm
-from rag import retrieve_sources
+from rag import compute_notes_hash, retrieve_sources
+from prefetch import clear as clear_prefetched, take as take_prefetched
+from router import resolve_model
 
 DEFAULT_OLLAMA_MODEL = "mistral:7b"
 
+
+def _load_notes(uploaded_file, pasted_text: str) -> tuple[str, list]:
+    """
+    Pasted notes win over the upload(s); uploads are only extracted when needed.
+    uploaded_file may be one UploadedFile or a list of them.
+    Returns (notes_text, unit spans for chunk positions).
+    """
+    if pasted_text and pasted_text.strip():
+        return clean_text(pasted_text.strip()), []
+    if not uploaded_file:
+        return "", []
+    return extract_notes(uploaded_file)
+
+
+def _load_notes_text(uploaded_file, pasted_text: str) -> str:
+    return _load_notes(uploaded_file, pasted_text)[0]
+
+
 def answer_question(
     uploaded_file,
     pasted_text: str,
@@ -15,10 +36,16 @@ def answer_question(
     top_k: int = 5,
     ui_log=None,
     model: str = DEFAULT_OLLAMA_MODEL,
+    mcq_fanout: bool = False,
+    session=None,
+    rerank: bool = False,
+    use_artifacts: bool = False,
 ) -> dict:
 
     """
     Orchestrates: extract -> clean -> retrieve -> LLM -> JSON.
+    Pass a llm_runner.StudySession to reuse a warm model and context prefix
+    across follow-up questions.
     Returns: dict (parsed JSON).
     """
 
@@ -32,21 +59,31 @@ def answer_question(
 
     log("STEP 1/3: Extracting + cleaning study text...")
 
-    extracted = extract_text_from_uploaded_file(uploaded_file) if uploaded_file is not None else ""
-    raw = pasted_text.strip() if (pasted_text and pasted_text.strip()) else extracted
-    notes_text = clean_text(raw)
+    notes_text = _load_notes_text(uploaded_file, pasted_text)
 
     log(f"Notes length: {len(notes_text)} chars. top_k={top_k}")
 
     if not notes_text:
-        raise ValueError("No study text found. Upload a PDF or paste your notes.")
+        raise ValueError("No study text found. Upload a document or paste your notes.")
 
     if not question or not question.strip():
         raise ValueError("Question is empty.")
 
+    if use_artifacts and mode in ("notes", "mcq"):
+        from artifacts import lookup
+        hit = lookup(compute_notes_hash(notes_text), question, mode)
+        if hit is not None:
+            log(f"Served from precomputed artifacts (topic={hit['precomputed']['topic']!r}).")
+            hit["result_id"] = uuid.uuid4().hex[:12]
+            return hit
+
     log("STEP 2/3: Retrieving context (Chroma top-k)...")
     # context = retrieve_context(notes_text=notes_text, question=question)
-    retr = retrieve_sources(notes_text=notes_text, question=question, top_k=top_k)
+    retr = take_prefetched(compute_notes_hash(notes_text), question, top_k=top_k, rerank=rerank)
+    if retr is not None:
+        log("Using context prefetched while the question was typed.")
+    else:
+        retr = retrieve_sources(notes_text=notes_text, question=question, top_k=top_k, rerank=rerank)
     context = retr["context"]
     sources = retr["sources"]
 
@@ -61,6 +98,9 @@ def answer_question(
         }
 
     log("STEP 3/3: Generating answer (Ollama)...")
+    if session is not None:
+        # pinned chunk order keeps the prompt prefix identical across questions
+        context = session.build_context([s["chunk"] for s in sources])
     context = context[:8000]
     # result = run_study_llm(
     #     model=model,
@@ -68,16 +108,31 @@ def answer_question(
     #     context=context,
     #     question=question,
     # )
-    result = run_study_llm(mode=mode, question=question, context=context, model=model)
+    result = run_study_llm(
+        mode=mode,
+        question=question,
+        context=context,
+        model=model,
+        mcq_fanout=mcq_fanout,
+        session=session,
+    )
 
     # Attach sources for UI (top-k retrieved chunks)
     result["sources"] = sources
+    result["result_id"] = uuid.uuid4().hex[:12]
 
     return result
 
-def index_only(uploaded_file, pasted_text: str, ui_log=None) -> dict:
+def index_only(
+    uploaded_file,
+    pasted_text: str,
+    ui_log=None,
+    precompute: bool = False,
+    model: str = DEFAULT_OLLAMA_MODEL,
+) -> dict:
     """
     Extract -> clean -> index into Chroma.
+    With precompute=True, queues background generation of per-topic notes/MCQs (artifacts.py).
     Returns a small status dict for UI.
     """
     def log(msg: str):
@@ -90,19 +145,99 @@ def index_only(uploaded_file, pasted_text: str, ui_log=None) -> dict:
 
     log("INDEX: Extracting + cleaning study text...")
 
-    extracted = extract_text_from_uploaded_file(uploaded_file) if uploaded_file is not None else ""
-    raw = pasted_text.strip() if (pasted_text and pasted_text.strip()) else extracted
-    notes_text = clean_text(raw)
+    notes_text, unit_spans = _load_notes(uploaded_file, pasted_text)
 
     if not notes_text:
-        raise ValueError("No study text found. Upload a PDF or paste your notes.")
+        raise ValueError("No study text found. Upload a document or paste your notes.")
 
     # ✅ index explicitly
     from rag import index_notes
-    notes_hash = index_notes(notes_text)
+    notes_hash = index_notes(notes_text, unit_spans=unit_spans)
+    clear_prefetched(notes_hash)  # re-indexed chunks may differ from prefetched ones
+
+    if precompute:
+        from artifacts import start_build
+        start_build(notes_hash, model)
+        log("INDEX: Study artifacts queued for background generation.")
 
     return {
         "status": "indexed",
         "notes_hash": notes_hash,
         "notes_len": len(notes_text),
     }
+
+def chat_turn(
+    chat,
+    uploaded_file,
+    pasted_text: str,
+    question: str,
+    top_k: int = 5,
+    ui_log=None,
+    model: str = DEFAULT_OLLAMA_MODEL,
+    rewrite_with_llm: bool = False,
+    session=None,
+    rerank: bool = False,
+) -> dict:
+    """
+    One follow-up turn of a chat.ChatSession:
+    rewrite follow-up -> retrieve (+ reuse previous chunks) -> LLM with compact history.
+    Returns: dict (qa schema) with sources and the retrieval query used.
+    """
+    def log(msg: str):
+        print(msg, flush=True)
+        if ui_log is not None:
+            try:
+                ui_log.write(msg)
+            except Exception:
+                pass
+
+    log("CHAT 1/3: Extracting + cleaning study text...")
+
+    notes_text = _load_notes_text(uploaded_file, pasted_text)
+
+    if not notes_text:
+        raise ValueError("No study text found. Upload a document or paste your notes.")
+
+    if not question or not question.strip():
+        raise ValueError("Question is empty.")
+
+    followup = chat.is_followup(question)
+    query = chat.rewrite_query(question, model=resolve_model(model, tier="small") if rewrite_with_llm else None)
+
+    log(f"CHAT 2/3: Retrieving context (followup={followup}, query={query!r})...")
+    retr = retrieve_sources(notes_text=notes_text, question=query, top_k=top_k, rerank=rerank)
+    sources = chat.merge_sources(retr["sources"], followup=followup)
+
+    if not sources:
+        return {
+            "mode": "qa",
+            "answer": "Insufficient context.",
+            "key_points": [],
+            "evidence": [],
+            "missing": "No relevant chunks were retrieved from the provided notes.",
+        }
+
+    chunks = [s["chunk"] for s in sources]
+    if session is not None:
+        context = session.build_context(chunks)
+    else:
+        context = "\n\n---\n\n".join(chunks)
+
+    log("CHAT 3/3: Generating answer (Ollama)...")
+    result = run_study_llm(
+        mode="qa",
+        question=question,
+        context=context,
+        model=model,
+        session=session,
+        history=chat.history_text(),
+    )
+
+    chat.add_turn(question, result, sources)
+
+    result["sources"] = sources
+    result["chat_turn"] = chat.turn_count
+    result["retrieval_query"] = query
+    result["result_id"] = uuid.uuid4().hex[:12]
+
+    return result
@@ -0,0 +1,126 @@
+# prefetch.py
+"""
+Speculative retrieval while the user is still on the form.
+
+When the question input changes, schedule() waits PREFETCH_DEBOUNCE_S (a newer
+question for the same UI session replaces the pending one), then runs
+rag.retrieve_indexed in a background thread. The Future is cached under
+(notes_hash, question, top_k, rerank); answer_question calls take() on submit
+and reuses the result instead of embedding + searching on the critical path.
+
+With a StudySession, the retrieved context is also prefilled into the model
+(StudySession.warm), so only the question and decoding remain after "Ask".
+"""
+from __future__ import annotations
+
+import copy
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+import rag
+
+PREFETCH_DEBOUNCE_S = 0.3
+PREFETCH_CACHE_SIZE = 32
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+# LLM warm-ups (up to a full prefill) run on their own single worker so they
+# never queue retrievals; a new one is skipped while one is in flight.
+_WARM_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch-warm")
+_WARMING: Optional[Future] = None
+_LOCK = threading.Lock()
+_CACHE: "OrderedDict[tuple, Future]" = OrderedDict()
+_PENDING: Dict[str, tuple] = {}  # slot (UI session) -> (key, Timer) of the debounced request
+
+
+def _key(notes_hash: str, question: str, top_k: int, rerank: bool) -> tuple:
+    return notes_hash, " ".join(question.split()), int(top_k), bool(rerank)
+
+
+def schedule(
+    notes_hash: Optional[str],
+    question: str,
+    top_k: int = 5,
+    rerank: bool = False,
+    session=None,
+    slot: str = "default",
+    delay_s: float = PREFETCH_DEBOUNCE_S,
+) -> None:
+    """
+    Debounced prefetch; a newer call for the same slot cancels the pending one.
+    """
+    if not notes_hash or not question or not question.strip():
+        return
+    key = _key(notes_hash, question, top_k, rerank)
+    timer = threading.Timer(delay_s, _start, args=(key, session))
+    timer.daemon = True
+    with _LOCK:
+        old = _PENDING.pop(slot, None)
+        if old is not None:
+            old[1].cancel()
+        _PENDING[slot] = (key, timer)
+    timer.start()
+
+
+def _start(key: tuple, session) -> None:
+    with _LOCK:
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            return
+        _CACHE[key] = _EXECUTOR.submit(_retrieve, key, session)
+        while len(_CACHE) > PREFETCH_CACHE_SIZE:
+            _CACHE.popitem(last=False)
+
+
+def _retrieve(key: tuple, session) -> dict:
+    notes_hash, question, top_k, rerank = key
+    print(f"Prefetch: retrieving top-{top_k} for {question[:60]!r} (notes_hash={notes_hash})", flush=True)
+    retr = rag.retrieve_indexed(notes_hash, question, top_k=top_k, rerank=rerank)
+    if session is not None and retr["sources"]:
+        _schedule_warm(session, [s["chunk"] for s in retr["sources"]])
+    return retr
+
+
+def _schedule_warm(session, chunks: list) -> None:
+    global _WARMING
+    with _LOCK:
+        if _WARMING is not None and not _WARMING.done():
+            return
+        # build_context is locked inside StudySession, so this cannot interleave with answer_question
+        _WARMING = _WARM_EXECUTOR.submit(_warm, session, session.build_context(chunks))
+
+
+def _warm(session, context: str) -> None:
+    try:
+        session.warm(context)
+    except Exception as e:
+        print(f"Prefetch: warm-up failed: {e}", flush=True)
+
+
+def take(notes_hash: str, question: str, top_k: int = 5, rerank: bool = False) -> Optional[dict]:
+    """
+    Prefetched retrieve_sources-style result for this question, waiting for an
+    in-flight one; None if nothing was prefetched or it failed.
+    A request still in its debounce window is cancelled: the caller retrieves now.
+    """
+    key = _key(notes_hash, question, top_k, rerank)
+    with _LOCK:
+        fut = _CACHE.get(key)
+        if fut is None:
+            for slot, (pending, timer) in list(_PENDING.items()):
+                if pending == key:
+                    timer.cancel()
+                    del _PENDING[slot]
+            return None
+    try:
+        return copy.deepcopy(fut.result())
+    except Exception as e:
+        print(f"Prefetch: failed, retrieving again: {e}", flush=True)
+        return None
+
+
+def clear(notes_hash: Optional[str] = None) -> None:
+    with _LOCK:
+        for key in [k for k in _CACHE if notes_hash is None or k[0] == notes_hash]:
+            del _CACHE[key]
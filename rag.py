@@ -3,6 +3,10 @@ from __future__ import annotations
 
 from typing import List
 import hashlib
+import json
+import os
+import threading
+from bisect import bisect_right
 from functools import lru_cache
 
 import chromadb
@@ -13,80 +17,183 @@ from sentence_transformers import SentenceTransformer
 EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 PERSIST_DIR = "chroma_db"
 COLLECTION_NAME = "study_notes"
+CHUNK_SIZE = 900
+CHUNK_OVERLAP = 150
+
+# "chroma" (float32 in Chroma) | "float16" | "int8" (compact store, see vector_store.py)
+VECTOR_MODE = os.environ.get("STUDY_VECTOR_MODE", "chroma")
+COMPACT_DIR = os.path.join(PERSIST_DIR, "compact")
+# Compact modes only: rescore this many top candidates in float32 for exact scores (0 = off);
+# when on, each document also keeps a float32 sidecar so rescoring reads vectors instead of re-embedding
+COMPACT_RESCORE = int(os.environ.get("STUDY_VECTOR_RESCORE", "0"))
 
 # Keeps track of which notes_text is currently indexed in this Streamlit session
 _INDEXED_HASH: str | None = None
 
+# Held by every write to the Chroma collection and by maintenance.compact(),
+# so a compaction never copies while chunks are being added or deleted.
+STORE_LOCK = threading.RLock()
+
 
 @lru_cache(maxsize=1)
 def get_embedder() -> SentenceTransformer:
     return SentenceTransformer(EMBED_MODEL_NAME)
 
 
-def _chunk_text(text: str, chunk_size: int = 900, overlap: int = 150) -> List[str]:
+def compute_notes_hash(notes_text: str) -> str:
+    return hashlib.sha256(notes_text.encode("utf-8")).hexdigest()[:12]
+
+
+def _chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
     """
     Minimal chunker.
     If you already have a chunking function, replace ONLY this function body with your existing one.
     """
+    return [text[a:b] for a, b in _chunk_spans(text, chunk_size, overlap)]
+
+
+def _chunk_spans(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[tuple]:
+    """
+    (start, end) offsets into `text` of the chunks _chunk_text returns.
+    """
+    lead = len(text) - len(text.lstrip())
     text = text.strip()
     if not text:
         return []
 
-    chunks: List[str] = []
+    spans: List[tuple] = []
     start = 0
     n = len(text)
 
     while start < n:
         end = min(n, start + chunk_size)
-        chunks.append(text[start:end])
+        spans.append((lead + start, lead + end))
         start = end - overlap
         if start < 0:
             start = 0
         if end == n:
             break
 
-    return [c for c in chunks if c.strip()]
+    return [(a, b) for a, b in spans if text[a - lead:b - lead].strip()]
 
 
-def _get_collection():
-    client = chromadb.PersistentClient(
+def _unit_at(spans: List[dict], offset: int) -> dict | None:
+    """
+    Extraction unit (page / slide / section) containing a char offset; spans are sorted by offset.
+    """
+    i = bisect_right([s["offset"] for s in spans], offset) - 1
+    return spans[i] if i >= 0 else None
+
+
+def _get_client():
+    return chromadb.PersistentClient(
         path=PERSIST_DIR,
         settings=Settings(anonymized_telemetry=False),
     )
-    return client.get_or_create_collection(name=COLLECTION_NAME)
 
 
-def index_notes(notes_text: str) -> str:
+def _pointer_path() -> str:
+    return os.path.join(PERSIST_DIR, f"{COLLECTION_NAME}.active.json")
+
+
+def read_collection_pointer() -> dict:
+    """
+    {"active": physical collection name, "retired": [...], "retired_at": {name: ts},
+    "pending": name | None}.
+    COLLECTION_NAME is a logical name: compaction builds a new physical collection
+    and switches this pointer, so the live one is never dropped before the switch.
+    """
+    try:
+        with open(_pointer_path(), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    return {"active": data.get("active") or COLLECTION_NAME, "retired": data.get("retired") or [],
+            "retired_at": data.get("retired_at") or {}, "pending": data.get("pending")}
+
+
+def write_collection_pointer(pointer: dict) -> None:
+    os.makedirs(PERSIST_DIR, exist_ok=True)
+    tmp = _pointer_path() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(pointer, f)
+    os.replace(tmp, _pointer_path())  # atomic: readers see the old or the new pointer
+
+
+def _get_collection():
+    return _get_client().get_or_create_collection(name=read_collection_pointer()["active"])
+
+
+@lru_cache(maxsize=1)
+def get_compact_store():
+    from vector_store import CompactStore
+    return CompactStore(COMPACT_DIR, dtype=VECTOR_MODE, keep_float32=COMPACT_RESCORE > 0)
+
+
+def _embed(texts: List[str]):
+    # float32 ndarray; passed through as-is (no .tolist() round-trip via Python floats)
+    return get_embedder().encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+
+
+def index_notes(
+    notes_text: str,
+    unit_spans: List[dict] | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+) -> str:
     """
-    Builds embeddings and persists to local Chroma.
+    Builds embeddings and persists to local Chroma (or the compact store).
+    unit_spans (from extract.extract_notes) add source / page / slide / section
+    metadata to each chunk, taken from the unit the chunk starts in.
+    Also records notes_hash as the indexed document for retrieve_sources.
     Returns notes_hash.
     """
-    col = _get_collection()
+    global _INDEXED_HASH
 
-    notes_hash = hashlib.sha256(notes_text.encode("utf-8")).hexdigest()[:12]
-    chunks = _chunk_text(notes_text)
+    notes_hash = compute_notes_hash(notes_text)
+    spans = _chunk_spans(notes_text, chunk_size, overlap)
+    chunks = [notes_text[a:b] for a, b in spans]
 
     if not chunks:
         return notes_hash
 
-    # ✅ Remove previous chunks for this same notes_hash to avoid duplicates
-    try:
-        col.delete(where={"notes_hash": notes_hash})
-    except Exception:
-        pass
-
-    ids = [f"{notes_hash}_{i}" for i in range(len(chunks))]
-    embeddings = get_embedder().encode(chunks, normalize_embeddings=True).tolist()
+    embeddings = _embed(chunks)
     metadatas = [{"notes_hash": notes_hash, "chunk_id": i} for i in range(len(chunks))]
-
-    print(f"Indexing {len(chunks)} chunks into Chroma (notes_hash={notes_hash})...", flush=True)
-
-    col.add(
-        ids=ids,
-        documents=chunks,
-        embeddings=embeddings,
-        metadatas=metadatas,
-    )
+    if unit_spans:
+        for meta, (a, _) in zip(metadatas, spans):
+            unit = _unit_at(unit_spans, a)
+            if unit is not None:
+                meta.update({"source": unit["source"], "unit_kind": unit["kind"], "unit_index": unit["index"]})
+
+    if VECTOR_MODE != "chroma":
+        print(f"Indexing {len(chunks)} chunks into compact {VECTOR_MODE} store (notes_hash={notes_hash})...", flush=True)
+        get_compact_store().add(notes_hash, chunks, embeddings, metadatas)
+    else:
+        with STORE_LOCK:
+            col = _get_collection()
+
+            # ✅ Remove previous chunks for this same notes_hash to avoid duplicates
+            try:
+                col.delete(where={"notes_hash": notes_hash})
+            except Exception:
+                pass
+
+            ids = [f"{notes_hash}_{i}" for i in range(len(chunks))]
+
+            print(f"Indexing {len(chunks)} chunks into Chroma (notes_hash={notes_hash})...", flush=True)
+
+            col.add(
+                ids=ids,
+                documents=chunks,
+                embeddings=embeddings,
+                metadatas=metadatas,
+            )
+
+    from maintenance import touch
+    touch(notes_hash, chunks=len(chunks))
+
+    # retrieve_sources must not re-index (and drop the unit metadata) on the next Ask
+    _INDEXED_HASH = notes_hash
 
     return notes_hash
 
@@ -98,7 +205,7 @@ def retrieve_context(notes_text: str, question: str, top_k: int = 5) -> str:
     """
     global _INDEXED_HASH
 
-    notes_hash = hashlib.sha256(notes_text.encode("utf-8")).hexdigest()[:12]
+    notes_hash = compute_notes_hash(notes_text)
 
     # ✅ Only index when notes change
     if _INDEXED_HASH != notes_hash:
@@ -121,25 +228,88 @@ def retrieve_context(notes_text: str, question: str, top_k: int = 5) -> str:
 
     return "\n\n---\n\n".join(docs)
 
-def retrieve_sources(notes_text: str, question: str, top_k: int = 5) -> dict:
+def retrieve_sources(
+    notes_text: str,
+    question: str,
+    top_k: int = 5,
+    rerank: bool = False,
+    candidates: int | None = None,
+) -> dict:
     """
     Returns retrieved chunks + metadata for UI display.
     Keeps existing retrieval behavior, just returns richer data.
+
+    With rerank=True, over-fetches `candidates` chunks and keeps the top_k best
+    by cross-encoder score (see rerank.py), so fewer chunks reach the prompt.
     """
     global _INDEXED_HASH
 
-    notes_hash = hashlib.sha256(notes_text.encode("utf-8")).hexdigest()[:12]
+    notes_hash = compute_notes_hash(notes_text)
 
     if _INDEXED_HASH != notes_hash:
         print("Indexing notes into Chroma...", flush=True)
         _INDEXED_HASH = index_notes(notes_text)
 
-    col = _get_collection()
-    q_emb = get_embedder().encode([question], normalize_embeddings=True).tolist()
+    return retrieve_indexed(notes_hash, question, top_k=top_k, rerank=rerank, candidates=candidates)
+
 
+def retrieve_indexed(
+    notes_hash: str,
+    question: str,
+    top_k: int = 5,
+    rerank: bool = False,
+    candidates: int | None = None,
+) -> dict:
+    """
+    retrieve_sources for notes that are already indexed (no notes text needed),
+    e.g. for prefetching from the notes_hash of the last index run.
+    """
+    from maintenance import touch
+    touch(notes_hash)
+
+    if rerank:
+        from rerank import RERANK_CANDIDATES, rerank_sources
+        n_results = max(candidates or RERANK_CANDIDATES, top_k)
+        sources = query_sources(notes_hash, question, top_k=n_results)
+        sources = rerank_sources(question, sources, top_k=top_k)
+    else:
+        sources = query_sources(notes_hash, question, top_k=top_k)
+
+    context = "\n\n---\n\n".join(s["chunk"] for s in sources) if sources else ""
+    return {"context": context, "sources": sources}
+
+
+def query_sources(notes_hash: str, question: str, top_k: int = 5) -> list[dict]:
+    """
+    Top-k chunks of one indexed document (by notes_hash) for a question.
+    """
+    q_emb = _embed([question])
+
+    if VECTOR_MODE != "chroma":
+        hits = get_compact_store().query(
+            q_emb[0],
+            top_k=top_k,
+            notes_hash=notes_hash,
+            rescore=COMPACT_RESCORE,
+            embed_fn=_embed,  # only for documents indexed before the sidecar was kept
+        )
+        return [
+            {
+                "rank": i + 1,
+                "chunk": h["chunk"],
+                "notes_hash": h["metadata"].get("notes_hash"),
+                "chunk_id": h["metadata"].get("chunk_id"),
+                "distance": h["distance"],
+                **_location(h["metadata"]),
+            }
+            for i, h in enumerate(hits)
+        ]
+
+    col = _get_collection()
     res = col.query(
         query_embeddings=q_emb,
         n_results=top_k,
+        where={"notes_hash": notes_hash},
         include=["documents", "metadatas", "distances"],
     )
 
@@ -155,8 +325,44 @@ def retrieve_sources(notes_text: str, question: str, top_k: int = 5) -> dict:
             "notes_hash": (metas[i] or {}).get("notes_hash"),
             "chunk_id": (metas[i] or {}).get("chunk_id"),
             "distance": dists[i] if i < len(dists) else None,
+            **_location(metas[i] or {}),
         })
 
-    context = "\n\n---\n\n".join(docs) if docs else ""
-    return {"context": context, "sources": sources}
+    return sources
 
+
+def _location(meta: dict) -> dict:
+    """
+    Where a chunk came from, e.g. {"source": "lecture3.pdf", "location": "page 12"}; {} if unknown.
+    """
+    if not meta.get("source"):
+        return {}
+    return {"source": meta["source"], "location": f"{meta.get('unit_kind', 'section')} {meta.get('unit_index')}"}
+
+
+def get_indexed_chunks(notes_hash: str) -> dict:
+    """
+    All stored chunks of one document, ordered by chunk_id:
+    {"documents": [...], "metadatas": [...], "embeddings": float32 ndarray (n, dim)}.
+    """
+    import numpy as np
+
+    if VECTOR_MODE != "chroma":
+        data = get_compact_store().get(notes_hash)
+    else:
+        data = _get_collection().get(
+            where={"notes_hash": notes_hash},
+            include=["documents", "metadatas", "embeddings"],
+        )
+
+    docs = data.get("documents") or []
+    metas = data.get("metadatas") or []
+    embs = data.get("embeddings")
+    embs = np.asarray(embs if embs is not None else [], dtype=np.float32)
+
+    order = sorted(range(len(docs)), key=lambda i: (metas[i] or {}).get("chunk_id", i))
+    return {
+        "documents": [docs[i] for i in order],
+        "metadatas": [metas[i] for i in order],
+        "embeddings": embs[order] if len(order) else embs.reshape(0, 0),
+    }
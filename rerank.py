@@ -0,0 +1,73 @@
+# rerank.py
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List
+
+# Small CPU cross-encoder; rescoring ~20 candidates takes tens of ms
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20
+RERANK_BATCH_SIZE = 16
+RERANK_CACHE_SIZE = 4096
+
+# (question, chunk sha1) -> score
+_SCORE_CACHE: "OrderedDict[tuple, float]" = OrderedDict()
+_SCORE_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def get_cross_encoder():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL_NAME, device="cpu", max_length=512)
+
+
+def _chunk_key(question: str, chunk: str) -> tuple:
+    return (question.strip(), hashlib.sha1(chunk.encode("utf-8")).hexdigest())
+
+
+def score_chunks(question: str, chunks: List[str], batch_size: int = RERANK_BATCH_SIZE) -> List[float]:
+    """
+    Cross-encoder relevance scores for (question, chunk) pairs.
+    Cached per (question, chunk hash); only uncached pairs hit the model, in batches.
+    """
+    keys = [_chunk_key(question, c) for c in chunks]
+    scores: List[float | None] = [None] * len(chunks)
+
+    with _SCORE_LOCK:
+        for i, k in enumerate(keys):
+            if k in _SCORE_CACHE:
+                _SCORE_CACHE.move_to_end(k)
+                scores[i] = _SCORE_CACHE[k]
+
+    todo = [i for i, s in enumerate(scores) if s is None]
+    if todo:
+        pairs = [(question, chunks[i]) for i in todo]
+        predicted = get_cross_encoder().predict(pairs, batch_size=batch_size, show_progress_bar=False)
+        with _SCORE_LOCK:
+            for i, s in zip(todo, predicted):
+                scores[i] = float(s)
+                _SCORE_CACHE[keys[i]] = float(s)
+            while len(_SCORE_CACHE) > RERANK_CACHE_SIZE:
+                _SCORE_CACHE.popitem(last=False)
+
+    return scores
+
+
+def rerank_sources(question: str, sources: List[Dict], top_k: int) -> List[Dict]:
+    """
+    Reorders retrieved sources by cross-encoder score and keeps the best top_k.
+    Adds "rerank_score"; "rank" is renumbered, "distance" is kept from retrieval.
+    """
+    if not sources:
+        return []
+
+    scores = score_chunks(question, [s.get("chunk") or "" for s in sources])
+    ordered = sorted(zip(sources, scores), key=lambda p: p[1], reverse=True)[:top_k]
+
+    return [
+        {**s, "rank": i + 1, "rerank_score": score}
+        for i, (s, score) in enumerate(ordered)
+    ]
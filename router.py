@@ -0,0 +1,188 @@
+# router.py
+"""
+Model routing for model="auto".
+
+Each request gets a tier (ROUTE_TIERS) from its mode and packed prompt size:
+short QA goes to the small model, notes / MCQ and long prompts to the large
+one. Each tier has one fixed num_ctx (Ollama reloads the model runner whenever
+num_ctx changes, which would also drop the KV cache StudySession relies on);
+only num_predict is sized per request, from the mode. If the small tier's
+output fails JSON validation (or the call fails), the request is retried once
+on the large tier; if that output is invalid too, the caller's well-formed
+"insufficient" result is returned. Latency and fallbacks are recorded per
+route (tier, mode).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Dict, Optional
+
+from chat import approx_tokens
+from ollama_client import ollama_chat
+
+AUTO_MODEL = "auto"
+
+ROUTE_TIERS = {
+    "small": os.environ.get("STUDY_MODEL_SMALL", "llama3.2:3b"),
+    "large": os.environ.get("STUDY_MODEL_LARGE", "mistral:7b"),
+}
+# QA prompts up to this many (approximate) tokens go to the small tier
+SMALL_MAX_PROMPT_TOKENS = 1500
+
+# Output budget per mode; "mcq_item" is one fan-out question
+NUM_PREDICT = {"qa": 512, "notes": 1024, "mcq": 1536, "mcq_item": 320, "rewrite": 64}
+# Fixed per tier: the small tier only takes prompts up to SMALL_MAX_PROMPT_TOKENS
+TIER_NUM_CTX = {"small": 4096, "large": 8192}
+ROUTE_TIMEOUT_S = {"qa": 60, "notes": 120, "mcq": 180, "mcq_item": 90, "rewrite": 30}
+
+ROUTE_STATS_WINDOW = 200  # latencies kept per route
+
+
+def resolve_model(model: str, tier: str = "large") -> str:
+    """
+    A concrete model name for callers that need one (StudySession, query rewrite).
+    """
+    return ROUTE_TIERS[tier] if model == AUTO_MODEL else model
+
+
+def plan(mode: str, prompt: str, tier: Optional[str] = None) -> Dict:
+    """
+    {"tier", "model", "options": {"num_ctx", "num_predict"}, "timeout_s", "prompt_tokens"} for one request.
+    """
+    prompt_tokens = approx_tokens(prompt)
+    if tier is None:
+        tier = "small" if mode in ("qa", "rewrite") and prompt_tokens <= SMALL_MAX_PROMPT_TOKENS else "large"
+    num_predict = NUM_PREDICT.get(mode, NUM_PREDICT["qa"])
+    num_ctx = TIER_NUM_CTX[tier]
+    if prompt_tokens + num_predict + 64 > num_ctx:  # 64: margin for the chat template
+        print(f"Router: ~{prompt_tokens} prompt tokens may not fit num_ctx={num_ctx} ({tier})", flush=True)
+    return {
+        "tier": tier,
+        "model": ROUTE_TIERS[tier],
+        "options": {"num_ctx": num_ctx, "num_predict": num_predict},
+        "timeout_s": ROUTE_TIMEOUT_S.get(mode, 120),
+        "prompt_tokens": prompt_tokens,
+    }
+
+
+class RouteStats:
+    """
+    Rolling per-route (tier, mode) latencies plus call / failure / fallback counts.
+    """
+
+    def __init__(self, window: int = ROUTE_STATS_WINDOW):
+        self._lock = threading.Lock()
+        self._latency = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(lambda: {"calls": 0, "failures": 0, "fallbacks": 0})
+
+    def record(self, tier: str, mode: str, latency_s: float, ok: bool, fallback: bool = False) -> None:
+        key = f"{tier}/{mode}"
+        with self._lock:
+            self._latency[key].append(latency_s)
+            c = self._counts[key]
+            c["calls"] += 1
+            c["failures"] += 0 if ok else 1
+            c["fallbacks"] += 1 if fallback else 0
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            out = {}
+            for key, lat in self._latency.items():
+                values = sorted(lat)
+                out[key] = {
+                    **self._counts[key],
+                    "p50_s": values[len(values) // 2] if values else None,
+                    "p95_s": values[min(len(values) - 1, int(0.95 * len(values)))] if values else None,
+                }
+            return out
+
+
+STATS = RouteStats()
+
+
+def run_routed(
+    mode: str,
+    prompt: str,
+    *,
+    system: str,
+    parse: Callable[[str], Dict],
+    on_invalid: Optional[Callable[[ValueError], Dict]] = None,
+    format=None,
+    temperature: float = 0.0,
+    chat_fn: Optional[Callable[..., str]] = None,
+) -> Dict:
+    """
+    Runs one request on its planned tier; parse(raw) must raise ValueError on
+    invalid output, which (like a failed call) retries on the large tier. The
+    returned dict gets a "route" entry describing the tier that answered.
+    If the last tier's output is invalid, on_invalid(error) supplies the result
+    (still with "route"); transport errors from the last tier are re-raised.
+    """
+    chat_fn = chat_fn or ollama_chat
+    first = plan(mode, system + prompt)
+    tiers = [first["tier"]] + (["large"] if first["tier"] != "large" else [])
+
+    for attempt, tier in enumerate(tiers):
+        route = plan(mode, system + prompt, tier=tier)
+        print(f"Router: {mode} -> {tier} ({route['model']}, num_ctx={route['options']['num_ctx']}, "
+              f"~{route['prompt_tokens']} prompt tokens)", flush=True)
+        t0 = time.perf_counter()
+        try:
+            raw = chat_fn(
+                route["model"],
+                prompt=prompt,
+                system=system,
+                temperature=temperature,
+                timeout_s=route["timeout_s"],
+                format=format,
+                options=route["options"],
+            )
+            result = parse(raw)
+        except Exception as e:
+            STATS.record(tier, mode, time.perf_counter() - t0, ok=False, fallback=attempt > 0)
+            print(f"Router: {tier} tier failed ({e}){', falling back to large' if tier != 'large' else ''}", flush=True)
+            if tier != tiers[-1]:
+                continue
+            if not isinstance(e, ValueError) or on_invalid is None:
+                raise
+            result = on_invalid(e)
+        else:
+            STATS.record(tier, mode, time.perf_counter() - t0, ok=True, fallback=attempt > 0)
+
+        result["route"] = {
+            "tier": tier,
+            "model": route["model"],
+            **route["options"],
+            "fallback": attempt > 0,
+        }
+        return result
+
+
+def routed_chat_fn(mode: str) -> Callable[..., str]:
+    """
+    An ollama_chat-compatible function for run_mcq_fanout: ignores the model
+    argument and sizes each call by plan(); failures surface to the caller's retries.
+    """
+    def chat(model, *, prompt, system="", temperature=0.0, timeout_s=None, format=None, **_):
+        route = plan(mode, system + prompt)
+        t0 = time.perf_counter()
+        try:
+            raw = ollama_chat(
+                route["model"],
+                prompt=prompt,
+                system=system,
+                temperature=temperature,
+                timeout_s=route["timeout_s"],
+                format=format,
+                options=route["options"],
+            )
+        except Exception:
+            STATS.record(route["tier"], mode, time.perf_counter() - t0, ok=False)
+            raise
+        STATS.record(route["tier"], mode, time.perf_counter() - t0, ok=True)
+        return raw
+
+    return chat
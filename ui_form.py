@@ -1,20 +1,107 @@
 # ui_form.py
+import uuid
+
 import streamlit as st
 
+from extract import supported_extensions
+
+
+def _prefetch_question():
+    """
+    on_change of the question box: start retrieval (and warm-up) before "Ask" is clicked.
+    Chat mode is skipped: follow-ups are rewritten before retrieval.
+    """
+    ss = st.session_state
+    index_info = ss.get("index_info")
+    if not index_info or ss.get("form_mode") == "chat":
+        return
+    from prefetch import schedule
+
+    session = None
+    if ss.get("form_reuse_session") and ss.get("form_model"):
+        # same session app.py reuses on "Ask", so the warmed prefix is the one it sends
+        from router import resolve_model
+        session_model = resolve_model(ss.get("form_model") or "")
+        session = ss.get("llm_session")
+        if session is None or session.model != session_model:
+            from llm_runner import StudySession
+            session = StudySession(model=session_model)
+            ss["llm_session"] = session
+    # st.session_state is one process-wide proxy, so id(ss) is shared by every browser
+    # session; a uuid kept in the session itself gives each one its own debounce slot
+    slot = ss.setdefault("prefetch_slot", uuid.uuid4().hex)
+    schedule(
+        index_info["notes_hash"],
+        ss.get("form_question", ""),
+        top_k=int(ss.get("form_top_k", 5)),
+        rerank=bool(ss.get("form_rerank", False)),
+        session=session,
+        slot=slot,
+    )
+
+
 def render_form_view():
     st.title("AI Study Assistant (RAG)")
 
-    mode = st.selectbox("Mode", ["qa", "notes", "mcq"], index=0)
-    question = st.text_input("Ask a question / topic")
+    mode = st.selectbox("Mode", ["qa", "notes", "mcq", "chat"], index=0, key="form_mode")
+    question = st.text_input("Ask a question / topic", key="form_question", on_change=_prefetch_question)
 
-    uploaded_file = st.file_uploader("Upload PDF (optional)", type=["pdf"])
+    uploaded_file = st.file_uploader(
+        "Upload notes (optional): " + ", ".join(supported_extensions()),
+        type=supported_extensions(),
+        accept_multiple_files=True,
+    )
     pasted_text = st.text_area("Or paste your notes (optional)", height=180)
 
     col1, col2 = st.columns(2)
     with col1:
-        model = st.text_input("Ollama model", value="mistral:7b")
+        model = st.text_input(
+            "Ollama model",
+            value="mistral:7b",
+            key="form_model",
+            help="'auto' picks a small or large model by mode and prompt size (see router.py).",
+        )
     with col2:
-        top_k = st.number_input("Top-k chunks", min_value=1, max_value=12, value=5)
+        top_k = st.number_input("Top-k chunks", min_value=1, max_value=12, value=5, key="form_top_k")
+
+    use_artifacts = False
+    if mode in ("notes", "mcq"):
+        use_artifacts = st.checkbox(
+            "Serve from pre-generated topic notes/MCQs when the topic matches",
+            value=False,
+            help="Only for short topic requests (no question mark); specific questions are always answered fresh.",
+        )
+        index_info = st.session_state.get("index_info")
+        if index_info:
+            from artifacts import status
+            st.caption(f"Pre-generated artifacts: {status(index_info['notes_hash'])}")
+
+    mcq_fanout = False
+    if mode == "mcq":
+        mcq_fanout = st.checkbox(
+            "Generate MCQs in parallel (one request per question)",
+            value=True,
+        )
+
+    rerank = st.checkbox(
+        "Rerank candidates with a cross-encoder (fewer, better chunks)",
+        value=False,
+        help="Over-fetches candidates, rescored on CPU; Top-k then means chunks kept after reranking.",
+        key="form_rerank",
+    )
+
+    reset_chat = False
+    if mode == "chat":
+        chat = st.session_state.get("chat")
+        if chat is not None and chat.turn_count:
+            st.caption(f"Conversation: {chat.turn_count} turn(s) so far. Follow-ups can refer to earlier answers.")
+        reset_chat = st.button("New conversation")
+
+    reuse_session = st.checkbox(
+        "Keep model warm and reuse the notes prefix across questions",
+        value=False,
+        key="form_reuse_session",
+    )
 
     ### Previous Code
     # submit = st.button("Run")
@@ -28,6 +115,11 @@ def render_form_view():
     #     "submit": submit,
     # }
 
+    precompute = st.checkbox(
+        "After indexing, pre-generate per-topic notes & MCQs in the background",
+        value=False,
+    )
+
     ### New Code
     colA, colB = st.columns(2)
     with colA:
@@ -42,6 +134,12 @@ def render_form_view():
         "pasted_text": pasted_text,
         "model": model,
         "top_k": int(top_k),
+        "mcq_fanout": mcq_fanout,
+        "reuse_session": reuse_session,
+        "reset_chat": reset_chat,
+        "rerank": rerank,
+        "use_artifacts": use_artifacts,
+        "precompute": precompute,
         "index_submit": index_submit,
         "ask_submit": ask_submit,
     }
@@ -1,130 +1,8 @@
 # ui_results.py
 import streamlit as st
-import json
 from datetime import datetime
 
-def _build_export_text(result: dict) -> str:
-    mode = result.get("mode", "")
-    lines = []
-    lines.append("AI Study Assistant (RAG) — Export")
-    lines.append(f"Mode: {mode}")
-    lines.append("")
-
-    missing = result.get("missing")
-    if missing:
-        lines.append(f"Missing: {missing}")
-        lines.append("")
-
-    # QA
-    if mode == "qa":
-        lines.append("Answer:")
-        lines.append(result.get("answer", ""))
-        lines.append("")
-
-        kps = result.get("key_points", [])
-        if kps:
-            lines.append("Key Points:")
-            for kp in kps:
-                lines.append(f"- {kp}")
-            lines.append("")
-
-        ev = result.get("evidence", [])
-        if ev:
-            lines.append("Evidence (quotes from notes):")
-            for e in ev:
-                lines.append(f"- {e}")
-            lines.append("")
-
-    # NOTES
-    elif mode == "notes":
-        topic = result.get("topic")
-        if topic:
-            lines.append(f"Topic: {topic}")
-            lines.append("")
-
-        rn = result.get("revision_notes", [])
-        if rn:
-            lines.append("Revision Notes:")
-            for r in rn:
-                lines.append(f"- {r}")
-            lines.append("")
-
-        defs = result.get("definitions", [])
-        if defs:
-            lines.append("Definitions:")
-            for d in defs:
-                term = d.get("term", "")
-                definition = d.get("definition", "")
-                lines.append(f"- {term}: {definition}")
-            lines.append("")
-
-        cm = result.get("common_mistakes", [])
-        if cm:
-            lines.append("Common Mistakes:")
-            for m in cm:
-                lines.append(f"- {m}")
-            lines.append("")
-
-        ev = result.get("evidence", [])
-        if ev:
-            lines.append("Evidence (quotes from notes):")
-            for e in ev:
-                lines.append(f"- {e}")
-            lines.append("")
-
-    # MCQ
-    elif mode == "mcq":
-        topic = result.get("topic")
-        if topic:
-            lines.append(f"Topic: {topic}")
-            lines.append("")
-
-        mcqs = result.get("mcqs", [])
-        if mcqs:
-            lines.append("MCQs:")
-            for i, q in enumerate(mcqs, start=1):
-                lines.append(f"Q{i}. {q.get('q','')}")
-                for opt in q.get("options", []):
-                    lines.append(f"  {opt}")
-                lines.append(f"Answer: {q.get('answer','')}")
-                exp = q.get("explanation")
-                if exp:
-                    lines.append(f"Explanation: {exp}")
-                ev = q.get("evidence", [])
-                if ev:
-                    lines.append("Evidence:")
-                    for e in ev:
-                        lines.append(f"- {e}")
-                lines.append("")
-        else:
-            lines.append("No MCQs generated.")
-            lines.append("")
-
-    else:
-        lines.append("Unknown mode.")
-        lines.append("")
-
-    # Sources
-    sources = result.get("sources", [])
-    if sources:
-        lines.append("Sources (Top-k retrieved chunks):")
-        for s in sources:
-            rank = s.get("rank")
-            chunk_id = s.get("chunk_id")
-            dist = s.get("distance")
-            header = f"#{rank}"
-            if chunk_id is not None:
-                header += f" chunk_id={chunk_id}"
-            if dist is not None:
-                header += f" distance={dist}"
-            lines.append(header)
-            chunk = (s.get("chunk") or "").strip()
-            lines.append(chunk)
-            lines.append("-" * 40)
-        lines.append("")
-
-    return "\n".join(lines)
-
+from export import get_export_bytes, get_bulk_export_bytes
 
 def render_results_view():
     st.title("AI Study Assistant (RAG) — Result")
@@ -144,8 +22,9 @@ def render_results_view():
 
     # -------- Export buttons --------
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    json_bytes = json.dumps(result, ensure_ascii=False, indent=2).encode("utf-8")
-    txt_bytes = _build_export_text(result).encode("utf-8")
+    # memoized per result id, so reruns don't re-serialize
+    json_bytes = get_export_bytes(result, "json")
+    txt_bytes = get_export_bytes(result, "txt")
 
     c1, c2 = st.columns(2)
     with c1:
@@ -163,9 +42,43 @@ def render_results_view():
             mime="text/plain",
         )
 
-    # Pretty JSON viewer
+    # Bulk export of this session's results: built only when asked for, since
+    # rebuilding it over the whole history on every new result is quadratic
+    history = st.session_state.get("results_history") or []
+    if len(history) > 1:
+        if st.button(f"Prepare bulk export ({len(history)} results)"):
+            st.session_state["bulk_export"] = list(history)
+        prepared = st.session_state.get("bulk_export")
+        if prepared:
+            st.caption(f"Export of {len(prepared)} results from this session"
+                       + (" (prepare again to include newer ones):" if prepared[-1] is not history[-1] else ":"))
+            b1, b2, b3 = st.columns(3)
+            with b1:
+                st.download_button(
+                    label="All (JSONL)",
+                    data=get_bulk_export_bytes(prepared, "jsonl"),
+                    file_name=f"study_assistant_results_{ts}.jsonl",
+                    mime="application/x-ndjson",
+                )
+            with b2:
+                st.download_button(
+                    label="All (TXT)",
+                    data=get_bulk_export_bytes(prepared, "txt"),
+                    file_name=f"study_assistant_results_{ts}.txt",
+                    mime="text/plain",
+                )
+            with b3:
+                st.download_button(
+                    label="Quiz (CSV)",
+                    data=get_bulk_export_bytes(prepared, "csv"),
+                    file_name=f"study_assistant_quiz_{ts}.csv",
+                    mime="text/csv",
+                )
+
+    # Pretty JSON viewer (only sent to the browser when asked for)
     st.subheader("Output (JSON)")
-    st.json(result)
+    if st.checkbox("Show raw JSON", value=False):
+        st.json(result)
 
     # Quick View
     st.subheader("Quick View")
@@ -174,9 +87,29 @@ def render_results_view():
     if result.get("answer") == "Insufficient context." or result.get("missing") == "Insufficient context.":
         st.warning("Insufficient context found in the provided notes.")
 
+    if result.get("repaired"):
+        st.warning("The model's output was cut off; this result was repaired and may be incomplete.")
+
     if result.get("missing") and result.get("missing") != "Insufficient context.":
         st.caption(f"Missing info: {result['missing']}")
 
+    if result.get("precomputed"):
+        pre = result["precomputed"]
+        st.caption(f"Served from pre-generated notes for topic: {pre.get('topic')} (similarity {pre.get('similarity', 0):.2f})")
+
+    if result.get("route"):
+        route = result["route"]
+        st.caption(
+            f"Model: {route.get('model')} ({route.get('tier')} tier, num_ctx={route.get('num_ctx')})"
+            + (" • fell back to the large model" if route.get("fallback") else "")
+        )
+        from router import STATS
+        if st.checkbox("Show routing stats", value=False):
+            st.json(STATS.summary())
+
+    if result.get("chat_turn"):
+        st.caption(f"Chat turn {result['chat_turn']} • retrieval query: {result.get('retrieval_query', '')}")
+
     if mode == "qa":
         st.write(result.get("answer", ""))
 
@@ -250,6 +183,9 @@ def render_results_view():
     sources = result.get("sources", [])
     if sources:
         st.subheader("Sources (Top-k retrieved chunks)")
+        # chunk text is only rendered on demand; each chunk can be ~900 chars
+        if not st.checkbox(f"Show {len(sources)} source chunks", value=False):
+            sources = []
         for s in sources:
             rank = s.get("rank")
             chunk_id = s.get("chunk_id")
@@ -261,6 +197,10 @@ def render_results_view():
                 header += f" • chunk_id={chunk_id}"
             if dist is not None:
                 header += f" • distance={dist:.4f}" if isinstance(dist, (int, float)) else f" • distance={dist}"
+            if s.get("source"):
+                header += f" • {s['source']} ({s.get('location', '')})"
+            if s.get("rerank_score") is not None:
+                header += f" • rerank={s['rerank_score']:.3f}"
 
             with st.expander(header, expanded=(rank == 1)):
                 st.write(chunk_text)
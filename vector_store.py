@@ -0,0 +1,247 @@
+# vector_store.py
+"""
+Compact on-disk vector store for large libraries (used when rag.VECTOR_MODE is
+"float16" or "int8" instead of "chroma").
+
+Per notes_hash, in COMPACT_DIR:
+  <hash>.<dtype>.npy   embeddings, float16 or int8 (n, dim)
+  <hash>.scale.npy     int8 only: per-row float32 scale (x ~= q * scale)
+  <hash>.float32.npy   optional (keep_float32): exact vectors for rescoring
+  <hash>.docs.json     chunks + metadata
+
+Bytes per 384-dim MiniLM vector: float32 1536, float16 768, int8 384 (+4 scale).
+Scoring is a blocked matrix-vector product over memory-mapped arrays, so only
+one block at a time is widened to float32. Optionally the top candidates are
+rescored exactly: from the memory-mapped float32 sidecar (only their rows are
+read, so it costs disk, not RAM), or by re-embedding their text when a
+document has no sidecar.
+Files are written to temporary names and os.replace()d under the store lock,
+so readers never see a half-written or mixed document.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SUPPORTED_DTYPES = ("float16", "int8")
+SCORE_BLOCK_ROWS = 65536
+OPEN_CACHE_SIZE = 32  # memory-mapped documents kept open
+
+
+def quantize(embeddings: np.ndarray, dtype: str) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Returns (stored matrix, per-row scale or None).
+    int8 uses symmetric per-row scaling: q = round(x / max|x| * 127).
+    """
+    x = np.asarray(embeddings, dtype=np.float32)
+    if dtype == "float16":
+        return x.astype(np.float16), None
+    if dtype == "int8":
+        scale = np.abs(x).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        q = np.clip(np.rint(x / scale[:, None]), -127, 127).astype(np.int8)
+        return q, scale.astype(np.float32)
+    raise ValueError(f"Unsupported dtype: {dtype}. Use one of {SUPPORTED_DTYPES}")
+
+
+def dequantize(mat: np.ndarray, scale: Optional[np.ndarray]) -> np.ndarray:
+    x = mat.astype(np.float32)
+    if scale is not None:
+        x *= scale[:, None]
+    return x
+
+
+def score(mat: np.ndarray, scale: Optional[np.ndarray], q: np.ndarray, block_rows: int = SCORE_BLOCK_ROWS) -> np.ndarray:
+    """
+    Dot-product scores of every stored row against query q (float32, normalized).
+    """
+    q = np.asarray(q, dtype=np.float32).reshape(-1)
+    out = np.empty(mat.shape[0], dtype=np.float32)
+    for start in range(0, mat.shape[0], block_rows):
+        block = mat[start:start + block_rows]
+        s = block.astype(np.float32) @ q
+        if scale is not None:
+            s *= scale[start:start + block_rows]
+        out[start:start + block_rows] = s
+    return out
+
+
+class CompactStore:
+    def __init__(self, path: str, dtype: str = "int8", keep_float32: bool = False):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype: {dtype}. Use one of {SUPPORTED_DTYPES}")
+        self.path = path
+        self.dtype = dtype
+        self.keep_float32 = keep_float32
+        self._open: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.RLock()  # held by writes and while a document's files are opened
+        os.makedirs(path, exist_ok=True)
+
+    # ---------- files ----------
+
+    def _file(self, notes_hash: str, kind: str) -> str:
+        if kind == "vec":
+            return os.path.join(self.path, f"{notes_hash}.{self.dtype}.npy")
+        if kind == "scale":
+            return os.path.join(self.path, f"{notes_hash}.scale.npy")
+        if kind == "float32":
+            return os.path.join(self.path, f"{notes_hash}.float32.npy")
+        return os.path.join(self.path, f"{notes_hash}.docs.json")
+
+    def hashes(self) -> List[str]:
+        suffix = f".{self.dtype}.npy"
+        return sorted(name[: -len(suffix)] for name in os.listdir(self.path) if name.endswith(suffix))
+
+    def counts(self) -> Dict[str, int]:
+        return {h: self._load(h)[0].shape[0] for h in self.hashes()}
+
+    # ---------- write ----------
+
+    def add(self, notes_hash: str, chunks: List[str], embeddings: np.ndarray, metadatas: List[dict]) -> None:
+        """
+        Writes (replaces) one document's vectors + chunks.
+        """
+        mat, scale = quantize(embeddings, self.dtype)
+        arrays = {"vec": mat, "scale": scale}
+        if self.keep_float32:
+            arrays["float32"] = np.asarray(embeddings, dtype=np.float32)
+
+        # the slow part (serializing) happens on temp files, outside the lock
+        tmp = {}
+        try:
+            for kind, arr in arrays.items():
+                if arr is not None:
+                    tmp[kind] = self._file(notes_hash, kind) + ".tmp"
+                    with open(tmp[kind], "wb") as f:
+                        np.save(f, arr)
+            tmp["docs"] = self._file(notes_hash, "docs") + ".tmp"
+            with open(tmp["docs"], "w", encoding="utf-8") as f:
+                json.dump({"documents": chunks, "metadatas": metadatas}, f, ensure_ascii=False)
+
+            with self._lock:
+                self._open.pop(notes_hash, None)
+                for kind in ("vec", "scale", "float32", "docs"):
+                    if kind in tmp:
+                        os.replace(tmp.pop(kind), self._file(notes_hash, kind))
+                    else:
+                        self._remove(notes_hash, kind)  # stale from an earlier add
+        finally:
+            for path in tmp.values():
+                self._remove_path(path)
+
+    def delete(self, notes_hash: str) -> None:
+        with self._lock:
+            self._open.pop(notes_hash, None)
+            for kind in ("vec", "scale", "float32", "docs"):
+                self._remove(notes_hash, kind)
+
+    def _remove(self, notes_hash: str, kind: str) -> None:
+        self._remove_path(self._file(notes_hash, kind))
+
+    @staticmethod
+    def _remove_path(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # ---------- read ----------
+
+    def _load(self, notes_hash: str) -> tuple:
+        with self._lock:
+            if notes_hash in self._open:
+                self._open.move_to_end(notes_hash)
+                return self._open[notes_hash]
+
+            mat = np.load(self._file(notes_hash, "vec"), mmap_mode="r")
+            scale = None
+            if self.dtype == "int8":
+                scale = np.load(self._file(notes_hash, "scale"))
+            with open(self._file(notes_hash, "docs"), encoding="utf-8") as f:
+                docs = json.load(f)
+            exact = None
+            if os.path.exists(self._file(notes_hash, "float32")):
+                exact = np.load(self._file(notes_hash, "float32"), mmap_mode="r")
+
+            entry = (mat, scale, docs, exact)
+            self._open[notes_hash] = entry
+            while len(self._open) > OPEN_CACHE_SIZE:
+                self._open.popitem(last=False)
+        return entry
+
+    def get(self, notes_hash: str) -> dict:
+        """
+        All chunks of one document: {"documents", "metadatas", "embeddings" (float32)}.
+        """
+        mat, scale, docs, exact = self._load(notes_hash)
+        return {**docs, "embeddings": np.array(exact) if exact is not None else dequantize(np.asarray(mat), scale)}
+
+    def query(
+        self,
+        q_emb: np.ndarray,
+        top_k: int = 5,
+        notes_hash: Optional[str] = None,
+        rescore: int = 0,
+        embed_fn=None,
+    ) -> List[dict]:
+        """
+        Top-k chunks by cosine similarity, for one document or (notes_hash=None) the whole library.
+        With rescore > 0, the best `rescore` candidates are reordered by exact
+        float32 score: from the sidecar rows, or re-embedded with embed_fn for
+        documents without one (left as scored if neither is available).
+        Returns [{"chunk", "metadata", "score", "distance"}] with distance = 2 - 2*score
+        (squared L2 on normalized vectors, matching Chroma's default space).
+        """
+        q = np.asarray(q_emb, dtype=np.float32).reshape(-1)
+        n_cand = max(top_k, rescore)
+
+        candidates = []  # (score, notes_hash, row)
+        loaded = {}
+        for h in ([notes_hash] if notes_hash else self.hashes()):
+            if not os.path.exists(self._file(h, "vec")):
+                continue
+            loaded[h] = self._load(h)
+            mat, scale = loaded[h][:2]
+            if mat.shape[0] == 0:
+                continue
+            s = score(mat, scale, q)
+            k = min(n_cand, s.shape[0])
+            idx = np.argpartition(-s, k - 1)[:k]
+            candidates += [(float(s[i]), h, int(i)) for i in idx]
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        candidates = candidates[:n_cand]
+
+        if rescore and candidates:
+            exact = {}
+            for h in {c[1] for c in candidates}:
+                rows = sorted(i for _, ch, i in candidates if ch == h)  # ascending: sequential reads
+                vectors = loaded[h][3]
+                if vectors is not None:
+                    s = np.asarray(vectors[rows], dtype=np.float32) @ q
+                elif embed_fn is not None:
+                    docs = loaded[h][2]["documents"]
+                    s = np.asarray(embed_fn([docs[i] for i in rows]), dtype=np.float32) @ q
+                else:
+                    continue
+                exact.update(zip(((h, i) for i in rows), s))
+            candidates = sorted(
+                ((float(exact.get((h, i), s)), h, i) for s, h, i in candidates),
+                key=lambda c: c[0],
+                reverse=True,
+            )
+
+        return [
+            {
+                "chunk": loaded[h][2]["documents"][i],
+                "metadata": loaded[h][2]["metadatas"][i],
+                "score": s,
+                "distance": 2.0 - 2.0 * s,
+            }
+            for s, h, i in candidates[:top_k]
+        ]